@@ -0,0 +1,222 @@
+"""Benchmarks of the parse, panelize, bounding box, preview and export paths on synthetic layers
+
+    python benchmarks/run.py --sizes 1000 10000 100000 --output baseline.json
+    python benchmarks/run.py --compare baseline.json
+
+Every benchmark runs in a fresh Project on a layer generated by synthetic.py, so results only depend on the sizes,
+the seed and the machine. Results are saved as JSON; --compare reports benchmarks that became slower than the
+baseline by more than --threshold and exits with status 1 if there are any.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygerbv
+from pygerbv import Image, Project
+
+import synthetic
+
+
+def _rss():
+    """Returns the current resident set size in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def _reset_peak_rss():
+    """Lowers the recorded peak RSS of the process to its current RSS; returns False where Linux does not allow it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """Returns the peak resident set size in bytes since the last _reset_peak_rss"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+
+def _open(path):
+    project = Project()
+    project.open_layer_from_filename(path)
+    return project
+
+
+def _measure(setup, run, repeat):
+    """Times run(state) on a fresh setup() repeat times; returns (seconds, native memory growth, peak RSS) in bytes
+
+    Setup and the teardown of the state are not timed. Memory growth is the RSS increase over all repeats once the
+    states are released, which points at native allocations that are never freed. Peak RSS is the highest RSS
+    reached during this benchmark alone, or None where the peak cannot be reset between benchmarks.
+    """
+    times = []
+    gc.collect()
+    rss_before = _rss()
+    peak_resettable = _reset_peak_rss()
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+        if isinstance(state, Project):
+            state.close()
+        del state
+    peak = _peak_rss() if peak_resettable else None
+    gc.collect()
+    return times, _rss() - rss_before, peak
+
+
+def benchmarks(directory, sizes, seed):
+    """Yields (name, size, items, setup, run) for every benchmark, where items is the work counted for throughput"""
+    for size in sizes:
+        gerber = os.path.join(directory, 'layer-{}.gbr'.format(size))
+        with open(gerber, 'w') as f:
+            f.write(synthetic.gerber(size, apertures=max(size // 1000, 10), seed=seed))
+        drill = os.path.join(directory, 'drill-{}.drl'.format(size))
+        with open(drill, 'w') as f:
+            f.write(synthetic.excellon(size, seed=seed))
+
+        yield 'open_layer_from_filename[gerber]', size, size, lambda: None, lambda _, path=gerber: _open(path).close()
+        yield 'open_layer_from_filename[excellon]', size, size, lambda: None, lambda _, path=drill: _open(path).close()
+        yield ('Image.__init__', size, size, lambda path=gerber: _open(path),
+               lambda project: Image(project.file[0].image._image))
+        yield ('Image.apertures', size, size, lambda path=gerber: _open(path),
+               lambda project: project.file[0].image.apertures)
+        yield ('Image.panelize[2x2]', size, size * 4, lambda path=gerber: _open(path),
+               lambda project: project.file[0].image.panelize([(0, 0), (10, 0), (0, 10), (10, 10)]))
+
+        yield ('Image.panelize[reparse,2x2]', size, size * 4, lambda path=gerber: _open(path),
+               lambda project: project.file[0].image.panelize([(0, 0), (10, 0), (0, 10), (10, 10)], in_memory=False))
+
+        # Regression run for panelizing with gerbv_image_duplicate_image, which LayerCache uses as well: arcs,
+        # regions and macros, panelized twice and then rendered, which is where gerbv crashed when copying parsed
+        # images directly
+        macros = os.path.join(directory, 'macros-{}.gbr'.format(size))
+        with open(macros, 'w') as f:
+            f.write(synthetic.gerber(size, apertures=max(size // 1000, 10), seed=seed, macro=True))
+
+        def panelize_twice(project):
+            image = project.file[0].image
+            image.panelize([(0, 0), (10, 0)])
+            image.panelize([(0, 0), (0, 10)])
+            project.render_to_array((1, 1), dpi=100)
+        yield 'Image.panelize[macros,2x2]', size, size * 4, lambda path=macros: _open(path), panelize_twice
+
+        def bounding_box(project):
+            project._invalidate_bounding_box()
+            project.bounding_box
+        yield 'Project.bounding_box', size, size, lambda path=gerber: _open(path), bounding_box
+
+        # min_feature_px=0 draws every net like a plain render, so the pair shows what skipping small nets saves
+        for min_feature_px in (0, 1):
+            yield ('Project.render_preview[min_feature_px={}]'.format(min_feature_px), size, size,
+                   lambda path=gerber: _open(path),
+                   lambda project, m=min_feature_px: project.render_preview(256, min_feature_px=m))
+
+        thumbnails = pygerbv.ThumbnailCache(os.path.join(directory, 'thumbnails-{}'.format(size)))
+
+        def preview_cached(path=gerber):
+            # Layers opened from bytes know the digest of their source, so hits skip walking the nets
+            project = Project()
+            with open(path, 'rb') as f:
+                project.open_layer_from_bytes(f.read(), os.path.basename(path))
+            project.render_preview(256, cache=thumbnails)
+            return project
+        yield ('Project.render_preview[cached]', size, size, preview_cached,
+               lambda project: project.render_preview(256, cache=thumbnails))
+
+        output = os.path.join(directory, 'output')
+        yield ('export_png_file', size, size, lambda path=gerber: _open(path),
+               lambda project: project.export_png_file(output + '.png', (10, 10)))
+        yield ('export_pdf_file', size, size, lambda path=gerber: _open(path),
+               lambda project: project.export_pdf_file(output + '.pdf', (10, 10)))
+        yield ('export_auto_sized_svg_file', size, size, lambda path=gerber: _open(path),
+               lambda project: project.export_auto_sized_svg_file(output + '.svg'))
+
+
+def run(sizes, repeat, seed, select=None):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, size, items, setup, function in benchmarks(directory, sizes, seed):
+            if select and select not in name:
+                continue
+            live_before = pygerbv.live_native_objects()
+            times, memory_growth, peak_rss = _measure(setup, function, repeat)
+            median = statistics.median(times)
+            results.append({
+                'name': name,
+                'size': size,
+                'median': median,
+                'min': min(times),
+                'max': max(times),
+                'throughput': items / median if median > 0 else None,
+                'memory_growth': memory_growth,
+                'live_native_objects': {kind: count - live_before[kind] for kind, count in pygerbv.live_native_objects().items()},
+                'peak_rss': peak_rss,
+            })
+            print('{:<36} {:>8} {:>10.4f}s {:>14.0f}/s {:>+10.1f} MiB'.format(
+                name, size, median, results[-1]['throughput'] or 0, memory_growth / 2 ** 20), flush=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Returns the (name, size, baseline median, median) of the benchmarks slower than the baseline by more than threshold"""
+    previous = {(result['name'], result['size']): result['median'] for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        key = (result['name'], result['size'])
+        if key in previous and result['median'] > previous[key] * (1 + threshold):
+            regressions.append((result['name'], result['size'], previous[key], result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Number of nets per layer')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--select', help='Only run benchmarks whose name contains this string')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare the results with this JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown tolerated by --compare, as a fraction')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.repeat, args.seed, args.select)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, size, before, after in regressions:
+            print('Regression: {} [{}] {:.4f}s -> {:.4f}s ({:+.0%})'.format(name, size, before, after, after / before - 1))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
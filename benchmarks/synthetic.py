@@ -0,0 +1,91 @@
+import math
+import random
+
+
+def _coordinate(value):
+    # Format 3.6, leading zeros omitted
+    return str(int(round(value * 10 ** 6)))
+
+
+def gerber(nets, apertures=10, arcs=0.1, regions=0.05, flashes=0.3, size=10.0, seed=0, macro=False):
+    """Returns RS-274X source with about nets nets spread over a size x size inch board
+
+    apertures circle, rectangle, obround and polygon apertures are defined, plus one ring aperture macro with macro.
+    arcs, regions and flashes are the fractions of nets that are arcs, region outlines (each region counting as one
+    net per edge) and flashes; the rest are lines.
+    """
+    rng = random.Random(seed)
+    lines = ['G04 Synthetic benchmark layer*', '%FSLAX36Y36*%', '%MOIN*%', '%LPD*%']
+    for i in range(apertures):
+        kind = i % 4
+        d = 0.005 + 0.05 * rng.random()
+        if kind == 0:
+            lines.append('%ADD{}C,{:.4f}*%'.format(10 + i, d))
+        elif kind == 1:
+            lines.append('%ADD{}R,{:.4f}X{:.4f}*%'.format(10 + i, d, d * 2))
+        elif kind == 2:
+            lines.append('%ADD{}O,{:.4f}X{:.4f}*%'.format(10 + i, d * 2, d))
+        else:
+            lines.append('%ADD{}P,{:.4f}X6*%'.format(10 + i, d))
+    if macro:
+        d = 0.005 + 0.05 * rng.random()
+        lines.append('%AMRING*1,1,$1,0,0*1,0,$2,0,0*%')
+        lines.append('%ADD{}RING,{:.4f}X{:.4f}*%'.format(10 + apertures, d * 2, d))
+    lines.append('G75*')
+
+    written = 0
+    while written < nets:
+        lines.append('D{}*'.format(10 + rng.randrange(apertures + bool(macro))))
+        x, y = rng.uniform(0, size), rng.uniform(0, size)
+        kind = rng.random()
+        if kind < regions:
+            radius = rng.uniform(0.05, 0.5)
+            corners = rng.randint(3, 8)
+            points = [(x + radius * math.cos(2 * math.pi * k / corners), y + radius * math.sin(2 * math.pi * k / corners))
+                      for k in range(corners)]
+            lines.append('G36*')
+            lines.append('G01X{}Y{}D02*'.format(_coordinate(points[0][0]), _coordinate(points[0][1])))
+            for px, py in points[1:] + points[:1]:
+                lines.append('X{}Y{}D01*'.format(_coordinate(px), _coordinate(py)))
+            lines.append('G37*')
+            written += corners
+        elif kind < regions + arcs:
+            radius = rng.uniform(0.02, 0.3)
+            start, stop = rng.uniform(0, 2 * math.pi), rng.uniform(0, 2 * math.pi)
+            lines.append('G01X{}Y{}D02*'.format(_coordinate(x + radius * math.cos(start)), _coordinate(y + radius * math.sin(start))))
+            lines.append('{}X{}Y{}I{}J{}D01*'.format(
+                rng.choice(('G02', 'G03')),
+                _coordinate(x + radius * math.cos(stop)),
+                _coordinate(y + radius * math.sin(stop)),
+                _coordinate(-radius * math.cos(start)),
+                _coordinate(-radius * math.sin(start))))
+            written += 1
+        elif kind < regions + arcs + flashes:
+            lines.append('X{}Y{}D03*'.format(_coordinate(x), _coordinate(y)))
+            written += 1
+        else:
+            length = rng.uniform(0.01, 0.5)
+            angle = rng.uniform(0, 2 * math.pi)
+            lines.append('G01X{}Y{}D02*'.format(_coordinate(x), _coordinate(y)))
+            lines.append('X{}Y{}D01*'.format(_coordinate(x + length * math.cos(angle)), _coordinate(y + length * math.sin(angle))))
+            written += 1
+    lines.append('M02*')
+    return '\n'.join(lines) + '\n'
+
+
+def excellon(hits, tools=8, size=10.0, seed=0):
+    """Returns Excellon drill source with hits holes spread over tools tools on a size x size inch board"""
+    rng = random.Random(seed)
+    lines = ['M48', 'INCH,TZ']
+    for i in range(tools):
+        lines.append('T{:02d}C{:.4f}'.format(i + 1, 0.008 + 0.004 * i))
+    lines.append('%')
+    lines.append('G90')
+    lines.append('G05')
+    per_tool = [hits // tools + (1 if i < hits % tools else 0) for i in range(tools)]
+    for i, count in enumerate(per_tool):
+        lines.append('T{:02d}'.format(i + 1))
+        for _ in range(count):
+            lines.append('X{:.4f}Y{:.4f}'.format(rng.uniform(0, size), rng.uniform(0, size)))
+    lines.append('M30')
+    return '\n'.join(lines) + '\n'
@@ -1,4 +1,10 @@
+from .apertures import *
+from .cache import *
+from .diff import *
 from .enumeration import *
 from .exceptions import *
 from .gerbv import *
+from .profiling import *
+from .stats import *
 from .structure import *
+from .writer import *
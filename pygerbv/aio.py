@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import weakref
+
+from .gerbv import Project
+
+
+__all__ = ['Executor', 'AsyncProject', 'default_executor']
+
+
+class Executor:
+    """Thread pool that runs blocking pygerbv calls for coroutines, at most max_workers at a time
+
+    Calls wait for a free worker on the event loop, not in the pool, so a call cancelled while waiting never runs.
+    A call that has already started cannot be interrupted; cancelling it keeps its worker busy until it returns.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='pygerbv')
+        # asyncio primitives belong to one event loop before Python 3.10, so keep a semaphore per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_workers)
+        async with semaphore:
+            future = self._pool.submit(function, *args, **kwargs)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # Hold the worker and any lock of the caller until the native call is really over
+                if not future.cancel():
+                    await asyncio.wait([asyncio.wrap_future(future)])
+                raise
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait)
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def default_executor():
+    """Returns the Executor shared by AsyncProjects created without one, creating it on first use"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = Executor()
+        return _default_executor
+
+
+class AsyncProject:
+    """Awaitable counterpart of Project, for use from asyncio code
+
+    Blocking calls run on an Executor so the event loop stays responsive. libgerbv objects are not thread-safe,
+    so the calls of one AsyncProject are serialized, while different projects proceed in parallel.
+    The wrapped Project is available as project for fast, non-blocking operations such as layer transforms;
+    do not use it while a call of this object is pending.
+    """
+
+    def __init__(self, project=None, executor=None):
+        self.project = Project() if project is None else project
+        self.executor = default_executor() if executor is None else executor
+        self._lock = None
+
+    async def run(self, function, *args, **kwargs):
+        """Calls function(*args, **kwargs) on the executor, serialized with the other calls on this project"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await self.executor.run(function, *args, **kwargs)
+
+    @property
+    def file(self):
+        return self.project.file
+
+    async def open_layer_from_filename(self, filename):
+        # Read the file up front, so its parse can run alongside those of other projects
+        return await self.run(self.project._open_layer_from_filename, filename, True)
+
+    async def open_layer_from_bytes(self, data, name='layer'):
+        return await self.run(self.project.open_layer_from_bytes, data, name)
+
+    async def open_layer_from_fileobj(self, fileobj, name='layer'):
+        return await self.run(self.project._open_layer_from_fileobj, fileobj, name, True)
+
+    async def render_to_array(self, size, dpi=72, out=None):
+        return await self.run(self.project.render_to_array, size, dpi, out)
+
+    async def render_tiled_to_array(self, out, dpi=72, tile_size=4096, workers=1):
+        return await self.run(self.project.render_tiled_to_array, out, dpi, tile_size, workers)
+
+    async def export_png_file(self, filename, size):
+        return await self.run(self.project.export_png_file, filename, size)
+
+    async def export_pdf_file(self, filename, size):
+        return await self.run(self.project.export_pdf_file, filename, size)
+
+    async def export_auto_sized_svg_file(self, filename):
+        return await self.run(self.project.export_auto_sized_svg_file, filename)
+
+    async def close(self):
+        await self.run(self.project.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
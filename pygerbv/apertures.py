@@ -0,0 +1,154 @@
+from ctypes import *
+
+import numpy as np
+
+from .enumeration import *
+from .structure import *
+
+
+__all__ = ['ApertureTable', 'transform_apertures']
+
+
+_APERTURE_SIZE = sizeof(GerbvAperture)
+
+# Byte layout of gerbv_aperture_t as a NumPy dtype, so raw copies of the apertures can be viewed as columns
+_APERTURE_DTYPE = np.dtype({
+    'names': ['type', 'amacro', 'simplified', 'parameter', 'nuf_parameters', 'unit'],
+    'formats': [np.intc, np.uintp, np.uintp, (np.float64, APERTURE_PARAMETERS_MAX), np.intc, np.intc],
+    'offsets': [GerbvAperture.type.offset,
+                GerbvAperture.amacro.offset,
+                GerbvAperture.simplified.offset,
+                GerbvAperture.parameter.offset,
+                GerbvAperture.nuf_parameters.offset,
+                GerbvAperture.unit.offset],
+    'itemsize': _APERTURE_SIZE,
+})
+
+
+class ApertureTable:
+    """The apertures of an image as flat arrays, ordered by D code
+
+    numbers, types, units and amacros hold one entry per aperture. The parameters of all apertures are
+    concatenated in parameters, and those of the i-th aperture are parameters[offsets[i]:offsets[i + 1]],
+    so a circle costs one double instead of a full gerbv_aperture_t.
+    """
+
+    def __init__(self, numbers, types, units, amacros, offsets, parameters):
+        self.numbers = numbers
+        self.types = types
+        self.units = units
+        self.amacros = amacros
+        self.offsets = offsets
+        self.parameters = parameters
+
+    @classmethod
+    def from_image(cls, image):
+        """Reads the apertures of a native image, copying each defined gerbv_aperture_t once"""
+        pointers = np.frombuffer(image.contents.aperture, dtype=np.uintp)
+        numbers = np.flatnonzero(pointers)
+        buffer = b''.join(string_at(address, _APERTURE_SIZE) for address in pointers[numbers].tolist())
+        records = np.frombuffer(buffer, dtype=_APERTURE_DTYPE)
+        # Apertures built outside the parser may not count their parameters, so keep any non-zero one as well
+        nonzero = records['parameter'] != 0
+        last_nonzero = np.where(nonzero.any(axis=1), APERTURE_PARAMETERS_MAX - np.argmax(nonzero[:, ::-1], axis=1), 0)
+        counts = np.clip(np.maximum(records['nuf_parameters'], last_nonzero), 0, APERTURE_PARAMETERS_MAX)
+        used = np.arange(APERTURE_PARAMETERS_MAX) < counts[:, None]
+        return cls(
+            numbers.astype(np.intc),
+            records['type'].copy(),
+            records['unit'].copy(),
+            records['amacro'].copy(),
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.intp),
+            # Adding 0.0 turns -0.0 into 0.0, so equal parameters compare equal as bytes
+            records['parameter'][used] + 0.0,
+        )
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def index(self, number):
+        """Returns the position of D code number in the table; raises KeyError if it is not defined"""
+        i = np.searchsorted(self.numbers, number)
+        if i == len(self.numbers) or self.numbers[i] != number:
+            raise KeyError(number)
+        return int(i)
+
+    def parameters_of(self, number):
+        """Returns a view of the parameters of D code number"""
+        i = self.index(number)
+        return self.parameters[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, number):
+        """Returns (type, unit, parameters) of D code number"""
+        i = self.index(number)
+        return ApertureType(self.types[i]), self.units[i], self.parameters[self.offsets[i]:self.offsets[i + 1]]
+
+    def duplicates(self):
+        """Returns {D code: D code of its first equivalent aperture} for every aperture that repeats an earlier one
+
+        Standard apertures are equivalent when their type, unit and parameters are equal. Macro apertures are
+        compared by macro definition as well, so only uses of the same definition with the same parameters merge.
+        """
+        first = {}
+        duplicates = {}
+        for i, number in enumerate(self.numbers.tolist()):
+            key = (int(self.types[i]), int(self.units[i]), int(self.amacros[i]),
+                   self.parameters[self.offsets[i]:self.offsets[i + 1]].tobytes())
+            if key in first:
+                duplicates[number] = first[key]
+            else:
+                first[key] = number
+        return duplicates
+
+
+def _aperture_changes(image, matrix):
+    """Returns {D code: {parameter index: value}} turning the apertures of image by the linear part of a rigid matrix
+
+    Raises ValueError if an aperture cannot be turned that way; see transform_apertures.
+    """
+    linear = np.asarray(matrix, dtype=np.float64)[:2, :2]
+    rotation = float(np.degrees(np.arctan2(linear[1, 0], linear[0, 0])))
+    reflected = bool(np.linalg.det(linear) < 0)
+    quarter_turns = int(round(rotation / 90))
+    right_angle = abs(rotation - 90 * quarter_turns) < 1e-9
+    if right_angle and quarter_turns % 4 == 0 and not reflected:
+        return {}
+
+    table = ApertureTable.from_image(image)
+    slots = image.contents.aperture
+    changes = {}
+    for number, type in zip(table.numbers.tolist(), table.types.tolist()):
+        if type in (ApertureType.NONE, ApertureType.CIRCLE):
+            continue
+        if type in (ApertureType.RECTANGLE, ApertureType.OVAL) and right_angle:
+            if quarter_turns % 2:
+                width, height = slots[number].contents.parameter[0:2]
+                changes[number] = {0: height, 1: width}
+        elif type == ApertureType.POLYGON:
+            # A regular polygon mirrors onto itself turned by minus its rotation
+            own = slots[number].contents.parameter[2]
+            changes[number] = {2: ((rotation - own) if reflected else (own + rotation)) % 360}
+        else:
+            raise ValueError('D{} is a {} aperture, which cannot be {}'.format(
+                number, ApertureType(type).name.lower(),
+                'mirrored' if right_angle and quarter_turns % 4 == 0 else 'turned by {:g} degrees'.format(rotation)))
+    return changes
+
+
+def transform_apertures(image, matrix, check=False):
+    """Turns and mirrors the apertures of a native image in place by the linear part of a rigid affine matrix
+
+    Circles are left as they are, rectangles and ovals swap width and height on odd quarter turns, and polygons
+    get the rotation added to their own. Anything else, i.e. rectangles and ovals turned by other than a multiple
+    of 90 degrees or macros turned or mirrored at all, raises ValueError before any aperture is changed.
+    With check, only raises and changes nothing.
+    """
+    changes = _aperture_changes(image, matrix)
+    if check:
+        return
+    slots = image.contents.aperture
+    for number, parameters in changes.items():
+        aperture = slots[number].contents
+        for index, value in parameters.items():
+            aperture.parameter[index] = value
+        aperture.nuf_parameters = max(aperture.nuf_parameters, max(parameters) + 1)
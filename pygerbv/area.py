@@ -0,0 +1,303 @@
+from ctypes import *
+
+import numpy as np
+
+from .enumeration import *
+from .netlist import net_extents, region_mask
+from .structure import *
+
+
+# Largest number of pieces a single stroke is split into when spreading it over grid cells
+_MAX_PIECES = 1024
+# Angle covered by each chord when region arcs are flattened into polygons
+_ARC_STEP = np.radians(5)
+
+
+def aperture_arrays(image):
+    """Returns the type and the first five parameters of every aperture slot of an image, indexed by aperture id"""
+    pointers = np.frombuffer(image.contents.aperture, dtype=np.uintp)
+    types = np.zeros(APERTURE_MAX, dtype=np.intc)
+    parameters = np.zeros((APERTURE_MAX, 5))
+    for aperture_id in np.flatnonzero(pointers).tolist():
+        aperture = GerbvAperture.from_address(int(pointers[aperture_id]))
+        types[aperture_id] = aperture.type
+        parameters[aperture_id] = aperture.parameter[:5]
+    return types, parameters
+
+
+def polarity_signs(layers):
+    """Returns -1 for nets drawn on a clear (LPC) layer and 1 otherwise"""
+    addresses, inverse = np.unique(layers, return_inverse=True)
+    signs = np.array([-1.0 if address and GerbvLayer.from_address(address).polarity == Polarity.CLEAR else 1.0
+                      for address in addresses.tolist()])
+    return signs[inverse] if len(signs) else np.ones(0)
+
+
+def _hole_areas(x, y):
+    return np.where(x > 0, np.where(y > 0, x * y, np.pi / 4 * x ** 2), 0)
+
+
+def _flash_areas(types, p):
+    areas = np.full(len(types), np.nan)
+    circle = types == ApertureType.CIRCLE
+    areas[circle] = (np.pi / 4 * p[circle, 0] ** 2 - _hole_areas(p[circle, 1], p[circle, 2]))
+    rectangle = types == ApertureType.RECTANGLE
+    areas[rectangle] = p[rectangle, 0] * p[rectangle, 1] - _hole_areas(p[rectangle, 2], p[rectangle, 3])
+    oval = types == ApertureType.OVAL
+    radius = np.minimum(p[oval, 0], p[oval, 1]) / 2
+    areas[oval] = p[oval, 0] * p[oval, 1] - (4 - np.pi) * radius ** 2 - _hole_areas(p[oval, 2], p[oval, 3])
+    polygon = (types == ApertureType.POLYGON) & (p[:, 1] >= 3)
+    vertices = p[polygon, 1]
+    areas[polygon] = (vertices / 2 * (p[polygon, 0] / 2) ** 2 * np.sin(2 * np.pi / vertices)
+                      - _hole_areas(p[polygon, 3], p[polygon, 4]))
+    return areas
+
+
+def _arc_sweeps(columns):
+    return np.radians(columns['angle2'] - columns['angle1'])
+
+
+def _stroke_lengths(columns, arcs):
+    lengths = np.hypot(columns['stop_x'] - columns['start_x'], columns['stop_y'] - columns['start_y'])
+    lengths[arcs] = (columns['cirseg_width'][arcs] / 2 * np.abs(_arc_sweeps(columns)[arcs]))
+    return lengths
+
+
+def _stroke_areas(types, p, columns, arcs):
+    lengths = _stroke_lengths(columns, arcs)
+    # Anything that is not a rectangle is stroked like a circle of its first parameter, as gerbv draws it
+    width = p[:, 0]
+    areas = lengths * width + np.pi / 4 * width ** 2
+    rectangle = types == ApertureType.RECTANGLE
+    w, h = p[rectangle, 0], p[rectangle, 1]
+    dx = np.abs(columns['stop_x'] - columns['start_x'])[rectangle]
+    dy = np.abs(columns['stop_y'] - columns['start_y'])[rectangle]
+    areas[rectangle] = np.where(arcs[rectangle], lengths[rectangle] * np.maximum(w, h), dx * h + dy * w) + w * h
+    return areas
+
+
+class _Primitives:
+    """Classification of the nets of a netlist into flashes, strokes and region edges"""
+
+    def __init__(self, columns, aperture_types, aperture_parameters):
+        interpolation = columns['interpolation']
+        state = columns['aperture_state']
+        in_region = region_mask(interpolation)
+        arcs = (interpolation == Interpolation.CW_CIRCULAR) | (interpolation == Interpolation.CCW_CIRCULAR)
+        lines = interpolation <= Interpolation.LINEARx001
+        self.columns = columns
+        self.arcs = arcs & np.isfinite(columns['cirseg_width'])
+        self.flashes = ~in_region & (state == ApertureState.FLASH)
+        self.strokes = ~in_region & (state == ApertureState.ON) & (lines | self.arcs)
+        self.region_edges = (in_region & (state != ApertureState.OFF) & (lines | self.arcs))
+        self.region_ids = np.cumsum(interpolation == Interpolation.PAREA_START)
+        apertures = np.clip(columns['aperture'], 0, APERTURE_MAX - 1)
+        self.types = aperture_types[apertures]
+        self.parameters = aperture_parameters[apertures]
+        self.signs = polarity_signs(columns['layer'])
+
+    def areas(self):
+        """Returns the area of every flash and stroke, and the absolute signed area of every region
+
+        Flashes and strokes with macro apertures fall back to the area of their bounding box.
+        """
+        left, bottom, right, top = net_extents(self.columns)
+        boxes = (right - left) * (top - bottom)
+        areas = np.zeros(len(self.types))
+        flashes = self.flashes
+        areas[flashes] = _flash_areas(self.types[flashes], self.parameters[flashes])
+        strokes = self.strokes
+        areas[strokes] = _stroke_areas(self.types[strokes], self.parameters[strokes], _subset(self.columns, strokes), self.arcs[strokes])
+        macros = (flashes | strokes) & ((self.types >= ApertureType.MACRO) | np.isnan(areas))
+        areas[macros] = boxes[macros]
+        return areas
+
+    def region_areas(self):
+        """Returns (region_ids, areas) of the G36/G37 regions"""
+        edges = self.region_edges
+        c = _subset(self.columns, edges)
+        terms = (c['start_x'] * c['stop_y'] - c['stop_x'] * c['start_y']) / 2
+        # An arc edge also encloses the circular segment between its chord and the arc
+        arcs = self.arcs[edges]
+        sweeps = _arc_sweeps(c)[arcs]
+        terms[arcs] += (c['cirseg_width'][arcs] / 2) ** 2 / 2 * (sweeps - np.sin(sweeps))
+        region_ids = self.region_ids[edges]
+        signed = np.bincount(region_ids, weights=terms, minlength=self.region_ids.max(initial=0) + 1)
+        ids = np.unique(region_ids)
+        return ids, np.abs(signed[ids])
+
+    def region_polygon_edges(self):
+        """Returns the region edges as straight segments (start_x, start_y, stop_x, stop_y, region_id), flattening arcs"""
+        edges = self.region_edges & ~self.arcs
+        c = self.columns
+        segments = [np.stack([c['start_x'][edges], c['start_y'][edges], c['stop_x'][edges], c['stop_y'][edges]], axis=1)]
+        ids = [self.region_ids[edges]]
+
+        arcs = self.region_edges & self.arcs
+        sweeps = _arc_sweeps(c)[arcs]
+        pieces = np.maximum(np.ceil(np.abs(sweeps) / _ARC_STEP), 1).astype(np.intp)
+        arc_index = np.repeat(np.arange(len(sweeps)), pieces)
+        step = np.arange(len(arc_index)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        radius = (c['cirseg_width'][arcs] / 2)[arc_index]
+        start = np.radians(c['angle1'][arcs])[arc_index]
+        delta = (sweeps / pieces)[arc_index]
+        a0 = start + step * delta
+        a1 = a0 + delta
+        cx = c['cp_x'][arcs][arc_index]
+        cy = c['cp_y'][arcs][arc_index]
+        segments.append(np.stack([cx + radius * np.cos(a0), cy + radius * np.sin(a0), cx + radius * np.cos(a1), cy + radius * np.sin(a1)], axis=1))
+        ids.append(self.region_ids[arcs][arc_index])
+        return np.concatenate(segments), np.concatenate(ids)
+
+
+def _subset(columns, mask):
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def copper_area(columns, aperture_types, aperture_parameters):
+    """Returns the copper area of a netlist in square inches, from its geometry
+
+    This is the sum of the areas of all flashes, strokes and regions, with clear (LPC) layers subtracted.
+    Primitives that overlap each other are counted once each.
+    """
+    primitives = _Primitives(columns, aperture_types, aperture_parameters)
+    area = np.sum(primitives.areas() * primitives.signs)
+    region_ids, region_areas = primitives.region_areas()
+    region_signs = primitives.signs[np.searchsorted(primitives.region_ids, region_ids)] if len(region_ids) else region_ids
+    return float(area + np.sum(region_areas * region_signs))
+
+
+class Grid:
+    """Square cells of cell_size inches, from origin (x, y) up and to the right, shape (rows, columns)"""
+
+    def __init__(self, origin, cell_size, shape):
+        self.origin = origin
+        self.cell_size = cell_size
+        self.shape = shape
+
+    @classmethod
+    def covering(cls, left, bottom, right, top, cell_size):
+        shape = (max(int(np.ceil((top - bottom) / cell_size)), 1), max(int(np.ceil((right - left) / cell_size)), 1))
+        return cls((left, bottom), cell_size, shape)
+
+
+def _spread_boxes(grid, density, areas, left, bottom, right, top):
+    """Adds areas to the cells, each spread over its box in proportion to how much of the box each cell covers"""
+    rows, columns = grid.shape
+    x0, y0 = grid.origin
+    size = grid.cell_size
+    ix0 = np.clip(np.floor((left - x0) / size), 0, columns - 1).astype(np.intp)
+    ix1 = np.clip(np.floor((right - x0) / size), 0, columns - 1).astype(np.intp)
+    iy0 = np.clip(np.floor((bottom - y0) / size), 0, rows - 1).astype(np.intp)
+    iy1 = np.clip(np.floor((top - y0) / size), 0, rows - 1).astype(np.intp)
+    widths = ix1 - ix0 + 1
+    counts = widths * (iy1 - iy0 + 1)
+    item = np.repeat(np.arange(len(areas)), counts)
+    offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    ix = ix0[item] + offsets % widths[item]
+    iy = iy0[item] + offsets // widths[item]
+    box_width = right - left
+    box_height = top - bottom
+    overlap_x = np.minimum(right[item], x0 + (ix + 1) * size) - np.maximum(left[item], x0 + ix * size)
+    overlap_y = np.minimum(top[item], y0 + (iy + 1) * size) - np.maximum(bottom[item], y0 + iy * size)
+    # Degenerate boxes (e.g. zero-width) are spread along the dimension they have
+    share_x = np.where(box_width[item] > 0, np.clip(overlap_x, 0, None) / np.where(box_width[item] > 0, box_width[item], 1), 1.0 / widths[item])
+    share_y = np.where(box_height[item] > 0, np.clip(overlap_y, 0, None) / np.where(box_height[item] > 0, box_height[item], 1), 1.0 / (iy1 - iy0 + 1)[item])
+    np.add.at(density, (iy, ix), areas[item] * share_x * share_y)
+
+
+def _stroke_pieces(primitives, areas, half_length):
+    """Splits every stroke into pieces no longer than half_length and returns (areas, left, bottom, right, top) of the pieces"""
+    c = _subset(primitives.columns, primitives.strokes)
+    arcs = primitives.arcs[primitives.strokes]
+    half_width = np.maximum(primitives.parameters[primitives.strokes, 0], primitives.parameters[primitives.strokes, 1]) / 2
+    lengths = _stroke_lengths(c, arcs)
+    pieces = np.clip(np.ceil(lengths / half_length), 1, _MAX_PIECES).astype(np.intp)
+    index = np.repeat(np.arange(len(pieces)), pieces)
+    step = np.arange(len(index)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    t0 = step / pieces[index]
+    t1 = (step + 1) / pieces[index]
+
+    x0 = c['start_x'][index] + (c['stop_x'] - c['start_x'])[index] * t0
+    y0 = c['start_y'][index] + (c['stop_y'] - c['start_y'])[index] * t0
+    x1 = c['start_x'][index] + (c['stop_x'] - c['start_x'])[index] * t1
+    y1 = c['start_y'][index] + (c['stop_y'] - c['start_y'])[index] * t1
+    on_arc = arcs[index]
+    radius = c['cirseg_width'][index][on_arc] / 2
+    angle1 = np.radians(c['angle1'][index][on_arc])
+    sweep = _arc_sweeps(c)[index][on_arc]
+    a0 = angle1 + sweep * t0[on_arc]
+    a1 = angle1 + sweep * t1[on_arc]
+    x0[on_arc] = c['cp_x'][index][on_arc] + radius * np.cos(a0)
+    y0[on_arc] = c['cp_y'][index][on_arc] + radius * np.sin(a0)
+    x1[on_arc] = c['cp_x'][index][on_arc] + radius * np.cos(a1)
+    y1[on_arc] = c['cp_y'][index][on_arc] + radius * np.sin(a1)
+
+    w = half_width[index]
+    return ((areas / pieces)[index],
+            np.minimum(x0, x1) - w, np.minimum(y0, y1) - w, np.maximum(x0, x1) + w, np.maximum(y0, y1) + w)
+
+
+def _region_coverage(grid, density, segments, region_ids, signs, rows_per_cell):
+    """Adds the area of the regions inside each cell, scanning rows_per_cell horizontal lines per cell row
+
+    Each region is filled with the even-odd rule along every scan line; coverage along a line is exact.
+    """
+    rows, columns = grid.shape
+    x0, y0 = grid.origin
+    size = grid.cell_size
+    spacing = size / rows_per_cell
+    sx, sy, ex, ey = segments.T
+    low = np.minimum(sy, ey)
+    high = np.maximum(sy, ey)
+    # Scan line r lies at y0 + (r + 0.5) * spacing; an edge crosses the lines in [low, high)
+    first = np.maximum(np.ceil((low - y0) / spacing - 0.5), 0).astype(np.intp)
+    last = np.minimum(np.ceil((high - y0) / spacing - 0.5), rows * rows_per_cell).astype(np.intp)
+    counts = np.maximum(last - first, 0)
+    edge = np.repeat(np.arange(len(segments)), counts)
+    line = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+    y = y0 + (line + 0.5) * spacing
+    x = sx[edge] + (y - sy[edge]) * (ex - sx)[edge] / (ey - sy)[edge]
+
+    order = np.lexsort((x, line, region_ids[edge]))
+    x = x[order]
+    line = line[order]
+    sign = signs[edge[order]]
+    # Within each (region, line) the sorted crossings pair up into filled spans
+    starts = x[0::2]
+    ends = x[1::2]
+    line = line[0::2]
+    sign = sign[0::2]
+
+    first_cell = np.clip(np.floor((starts - x0) / size), 0, columns - 1).astype(np.intp)
+    last_cell = np.clip(np.floor((ends - x0) / size), 0, columns - 1).astype(np.intp)
+    counts = last_cell - first_cell + 1
+    span = np.repeat(np.arange(len(starts)), counts)
+    cell = first_cell[span] + np.arange(len(span)) - np.repeat(np.cumsum(counts) - counts, counts)
+    overlap = np.minimum(ends[span], x0 + (cell + 1) * size) - np.maximum(starts[span], x0 + cell * size)
+    np.add.at(density, (line[span] // rows_per_cell, cell), np.clip(overlap, 0, None) * spacing * sign[span])
+
+
+def density_grid(columns, aperture_types, aperture_parameters, grid, rows_per_cell=4):
+    """Returns the copper coverage fraction of every cell of the grid, as an array of grid.shape
+
+    Row 0 is the bottom row of cells. Regions are filled by scan lines, while the area of flashes and of
+    short pieces of strokes is spread over the cells their bounding boxes overlap.
+    Coverage is clipped to [0, 1], since overlapping primitives are counted once each.
+    """
+    primitives = _Primitives(columns, aperture_types, aperture_parameters)
+    density = np.zeros(grid.shape)
+    areas = primitives.areas() * primitives.signs
+
+    flashes = primitives.flashes
+    left, bottom, right, top = net_extents(columns)
+    _spread_boxes(grid, density, areas[flashes], left[flashes], bottom[flashes], right[flashes], top[flashes])
+    _spread_boxes(grid, density, *_stroke_pieces(primitives, areas[primitives.strokes], grid.cell_size / 2))
+
+    segments, region_ids = primitives.region_polygon_edges()
+    horizontal = segments[:, 1] == segments[:, 3]
+    segments, region_ids = segments[~horizontal], region_ids[~horizontal]
+    region_signs = primitives.signs[np.searchsorted(primitives.region_ids, region_ids)] if len(region_ids) else np.zeros(0)
+    _region_coverage(grid, density, segments, region_ids, region_signs, rows_per_cell)
+
+    return np.clip(density / grid.cell_size ** 2, 0, 1)
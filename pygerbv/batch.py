@@ -0,0 +1,100 @@
+from dataclasses import dataclass, field
+import multiprocessing
+import time
+import traceback
+from typing import List, Optional, Tuple
+
+from .gerbv import Project
+
+
+@dataclass
+class Layer:
+    filename: str
+    color: Tuple[float, float, float, float] = (0, 0, 0, 0)
+    alpha: float = 1.0
+    translate: Tuple[float, float] = (0, 0)
+    scale: Tuple[float, float] = (1, 1)
+    rotate: float = 0
+    mirror: Tuple[bool, bool] = (False, False)
+    inverted: bool = False
+
+
+@dataclass
+class Output:
+    """A file to export; format is one of 'png', 'pdf' or 'svg'. size is required for png and pdf"""
+    format: str
+    filename: str
+    size: Optional[Tuple[float, float]] = None
+
+
+@dataclass
+class Job:
+    layers: List[Layer]
+    outputs: List[Output]
+    background: Tuple[float, float, float, float] = (0, 1, 1, 1)
+    name: Optional[str] = None
+
+
+@dataclass
+class JobResult:
+    job: Job
+    ok: bool
+    elapsed: float
+    timings: dict = field(default_factory=dict)
+    error_type: Optional[str] = None
+    error: Optional[str] = None
+    traceback: Optional[str] = None
+
+
+def _export(project, output):
+    if output.format == 'png':
+        project.export_png_file(output.filename, output.size)
+    elif output.format == 'pdf':
+        project.export_pdf_file(output.filename, output.size)
+    elif output.format == 'svg':
+        project.export_auto_sized_svg_file(output.filename)
+    else:
+        raise ValueError('Unknown output format: {}'.format(output.format))
+
+
+def run_job(job):
+    """Runs a single job in the current process and returns its JobResult"""
+    timings = {}
+    started = time.perf_counter()
+    try:
+        with Project() as project:
+            project.background = job.background
+            for layer in job.layers:
+                t = time.perf_counter()
+                file_info = project.open_layer_from_filename(layer.filename)
+                timings['open:' + layer.filename] = time.perf_counter() - t
+                file_info.color = layer.color
+                file_info.alpha = layer.alpha
+                file_info.scale(*layer.scale)
+                file_info.rotate(layer.rotate)
+                file_info.translate(*layer.translate)
+                file_info.mirror(*layer.mirror)
+                file_info.inverted = layer.inverted
+            for output in job.outputs:
+                t = time.perf_counter()
+                _export(project, output)
+                timings['export:' + output.filename] = time.perf_counter() - t
+    except Exception as e:
+        return JobResult(job, False, time.perf_counter() - started, timings,
+                         type(e).__name__, str(e), traceback.format_exc())
+    return JobResult(job, True, time.perf_counter() - started, timings)
+
+
+def imap(jobs, processes=None, chunksize=1, maxtasksperchild=None):
+    """Runs the jobs in a process pool and yields their JobResults in the order of the jobs"""
+    with multiprocessing.Pool(processes, maxtasksperchild=maxtasksperchild) as pool:
+        yield from pool.imap(run_job, jobs, chunksize)
+
+
+def render(jobs, processes=None, chunksize=1, maxtasksperchild=None):
+    """Runs the jobs in a process pool and returns the list of their JobResults
+
+    processes defaults to the number of CPUs. A failed job does not stop the others;
+    its exception is reported in its JobResult.
+    """
+    return list(imap(jobs, processes, chunksize, maxtasksperchild))
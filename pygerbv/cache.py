@@ -0,0 +1,259 @@
+from collections import OrderedDict
+from ctypes import *
+from dataclasses import dataclass
+from typing import Dict, Optional
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+from .gerbv import Image, _count, _destroy, _libgerbv
+from .netlist import read_nets, remap_apertures
+from .structure import *
+
+
+__all__ = ['LayerCache', 'CachedLayer', 'ThumbnailCache', 'CacheStats']
+
+
+def _cache_directory():
+    directory = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(directory, 'pygerbv')
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+
+
+@dataclass
+class CachedLayer:
+    """A duplicate of a cached image, with the name and parser statistics of the file it was parsed from
+
+    stats maps LayerType.RS274X and LayerType.DRILL to the GerberStats or DrillStats of the parse, if any.
+    """
+    image: object
+    name: Optional[bytes]
+    full_pathname: Optional[bytes]
+    stats: Dict[LayerType, object]
+
+
+def _duplicate(image, numbers):
+    """Duplicates image, whose defined apertures had the D codes numbers when it was parsed
+
+    gerbv_image_duplicate_image renumbers the defined apertures consecutively from D10, keeping their order,
+    so the duplicate gets the parsed numbering back: the aperture pointers move to their original slots and
+    the nets are remapped accordingly.
+    """
+    image = _libgerbv.gerbv_image_duplicate_image(image, GerbvUserTransformation(0, 0, 1, 1, 0, False, False, False))
+    pointers = np.frombuffer(image.contents.aperture, dtype=np.uintp)
+    current = np.flatnonzero(pointers)
+    if len(current) == len(numbers) and not np.array_equal(current, numbers):
+        moved = pointers[current].copy()
+        pointers[current] = 0
+        pointers[numbers] = moved
+        remap = np.arange(APERTURE_MAX, dtype=np.intc)
+        remap[current] = numbers
+        remap_apertures(image.contents.netlist, remap)
+    return image
+
+
+def _estimate_size(image):
+    """Estimates the native memory held by a parsed image from its nets, arcs and apertures"""
+    records, _ = read_nets(image.contents.netlist)
+    apertures = np.frombuffer(image.contents.aperture, dtype=np.uintp)
+    return (sizeof(GerbvImage)
+            + len(records) * sizeof(GerbvNet)
+            + int(np.count_nonzero(records['cirseg'])) * sizeof(GerbvCirseg)
+            + int(np.count_nonzero(apertures)) * sizeof(GerbvAperture))
+
+
+def _destroy_entries(entries):
+    while entries:
+        _, (image, _, _) = entries.popitem(last=False)
+        _destroy('image', _libgerbv.gerbv_destroy_image, image)
+
+
+class LayerCache:
+    """Content-addressed cache of parsed layers, shared by any number of Projects
+
+    The cache keeps its own duplicate of every image it stores and hands out further duplicates on hits,
+    so cached images are never shared with a project. Duplicates keep the D codes of the parsed file, and the
+    layer name and parser statistics are kept alongside, so a hit looks the same as parsing the file again.
+    Least recently used entries are evicted once either max_entries or the estimated max_bytes of native memory
+    is exceeded.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._finalizer = weakref.finalize(self, _destroy_entries, self._entries)
+        self._finalizer.atexit = False
+
+    @staticmethod
+    def key(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """Returns a new duplicate of the image cached for key, or None"""
+        layer = self.get_layer(key)
+        return layer.image if layer is not None else None
+
+    def get_layer(self, key):
+        """Returns a CachedLayer holding a new duplicate of the image cached for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            image, _, (numbers, name, full_pathname, stats) = entry
+            return CachedLayer(_duplicate(image, numbers), name, full_pathname, stats)
+
+    def put(self, key, image, name=None, full_pathname=None):
+        """Caches a duplicate of image, freshly parsed, for key; image itself stays owned by the caller"""
+        parsed = Image(image)
+        stats = {layer_type: stats for layer_type, stats in ((LayerType.RS274X, parsed.stats), (LayerType.DRILL, parsed.drill_stats)) if stats is not None}
+        numbers = np.flatnonzero(np.frombuffer(image.contents.aperture, dtype=np.uintp))
+        image = _duplicate(image, numbers)
+        _count('image', 1)
+        size = _estimate_size(image)
+        if size > self.max_bytes:
+            _destroy('image', _libgerbv.gerbv_destroy_image, image)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (image, size, (numbers, name, full_pathname, stats))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            _destroy_entries(self._entries)
+            self._bytes = 0
+
+    def _remove(self, key):
+        image, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        _destroy('image', _libgerbv.gerbv_destroy_image, image)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._entries), self._bytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ThumbnailCache:
+    """Disk cache of rendered previews, shared by processes using the same directory
+
+    Every preview is stored as a .npy file named after its key, by default in the thumbnails directory of the
+    pygerbv user cache. Hits refresh the modification time of the file, and the least recently used files are
+    deleted once the files together exceed max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or os.path.join(_cache_directory(), 'thumbnails')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(*parts):
+        """Returns a key for the given parts, which must have a stable repr (numbers, strings, tuples, ...)"""
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """Returns the preview cached for key, or None"""
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return array
+
+    def put(self, key, array):
+        # The cache only saves time, so failing to write it is not an error
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                np.save(f, array)
+            # Readers see either no file or a complete one
+            os.replace(f.name, self._path(key))
+            self._evict()
+        except OSError:
+            pass
+
+    def _files(self):
+        """Returns (mtime, size, path) of every cached preview, least recently used first"""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return files
+        for entry in entries:
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(files)
+
+    def _evict(self):
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._evictions += 1
+
+    def clear(self):
+        for _, _, path in self._files():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    @property
+    def stats(self):
+        files = self._files()
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(files), sum(size for _, size, _ in files))
+
+    def __len__(self):
+        return len(self._files())
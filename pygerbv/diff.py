@@ -0,0 +1,248 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .enumeration import *
+from .netlist import region_mask
+
+
+__all__ = ['DiffResult']
+
+
+@dataclass
+class DiffResult:
+    """Differences between two netlists, as indices into their netlist_arrays
+
+    removed are nets of the first image without a counterpart in the second, added the reverse.
+    moved pairs (first index, second index) of nets with the same shape and aperture that moved by at most
+    max_offset, each paired with the nearest one, and offsets are the (dx, dy) they moved by.
+    unchanged counts the nets matched in place.
+    """
+    added: np.ndarray
+    removed: np.ndarray
+    moved: np.ndarray
+    offsets: np.ndarray
+    unchanged: int
+
+    @property
+    def changed(self):
+        return len(self.added) > 0 or len(self.removed) > 0 or len(self.moved) > 0
+
+
+def _drawn(columns):
+    drawn = (columns['aperture_state'] != ApertureState.OFF) | region_mask(columns['interpolation'])
+    return np.flatnonzero(drawn & (columns['interpolation'] != Interpolation.DELETED))
+
+
+def _geometry(columns, nets):
+    """Returns (n, 6) start, stop and arc center coordinates, with the endpoints of straight lines in a canonical order"""
+    start = np.stack([columns['start_x'][nets], columns['start_y'][nets]], axis=1)
+    stop = np.stack([columns['stop_x'][nets], columns['stop_y'][nets]], axis=1)
+    center = np.stack([columns['cp_x'][nets], columns['cp_y'][nets]], axis=1)
+    # A line drawn from B to A is the same copper as one drawn from A to B
+    straight = columns['interpolation'][nets] <= Interpolation.LINEARx001
+    swap = straight & ((stop[:, 0] < start[:, 0]) | ((stop[:, 0] == start[:, 0]) & (stop[:, 1] < start[:, 1])))
+    start[swap], stop[swap] = stop[swap], start[swap]
+    # Nets other than arcs have no center; using the start point keeps their geometry relative to it all zero
+    no_center = ~np.isfinite(center)
+    center[no_center] = start[no_center]
+    return np.concatenate([start, stop, center], axis=1)
+
+
+def _hash_columns(columns):
+    """Hashes the values of the columns, row by row, into uint64s with an FNV-1a style mix of 64-bit words
+
+    uint64 columns, such as earlier hashes, are mixed in as they are; other columns are taken as float64.
+    """
+    hashes = np.full(len(columns[0]), 0xcbf29ce484222325, dtype=np.uint64)
+    for column in columns:
+        if column.dtype != np.uint64:
+            # Adding 0.0 turns -0.0 into 0.0, so equal numbers hash equally
+            column = (column.astype(np.float64) + 0.0).view(np.uint64)
+        hashes ^= column
+        hashes *= np.uint64(0x100000001b3)
+        hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+def _shapes(columns, apertures, nets):
+    """Hashes the aperture geometry, state and interpolation of each net
+
+    Apertures are compared by type and parameters rather than D code, so renumbered apertures still match.
+    """
+    types, parameters = apertures
+    aperture = np.clip(columns['aperture'][nets], 0, len(types) - 1)
+    return _hash_columns([types[aperture], *np.round(parameters[aperture], 9).T,
+                          columns['aperture_state'][nets], columns['interpolation'][nets]])
+
+
+def _ranked(keys):
+    """Numbers the occurrences of every key 0, 1, 2, ... and hashes each key with its number"""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    firsts = np.concatenate([[0], np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1])
+    ranks = np.empty(len(keys), dtype=np.intp)
+    ranks[order] = np.arange(len(keys)) - np.repeat(firsts, np.diff(np.append(firsts, len(keys))))
+    return _hash_columns([keys, ranks])
+
+
+def _match(keys_a, keys_b):
+    """Pairs equal hashes of keys_a and keys_b, each used at most once; returns the two index arrays
+
+    Duplicate keys are paired in order of appearance, so n copies on one side match min(n, m) copies on the other.
+    """
+    if len(keys_a) == 0 or len(keys_b) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    _, index_a, index_b = np.intersect1d(_ranked(keys_a), _ranked(keys_b), assume_unique=True, return_indices=True)
+    return index_a, index_b
+
+
+def _match_quantized(shapes_a, geometry_a, shapes_b, geometry_b, cell, offset):
+    keys_a = _hash_columns([shapes_a, *np.floor(geometry_a / cell + offset).T])
+    keys_b = _hash_columns([shapes_b, *np.floor(geometry_b / cell + offset).T])
+    return _match(keys_a, keys_b)
+
+
+def _candidates(shapes_a, points_a, shapes_b, points_b, radius):
+    """Returns the pairs (i, j) of nets with the same shape whose points are at most radius apart on both axes
+
+    Points of b are bucketed in a grid of 2 * radius cells, so the points within radius of a point lie in the
+    2 x 2 cells around it; candidate pairs come from joining the buckets and are then checked.
+    """
+    cell = 2 * radius
+    keys_b = _hash_columns([shapes_b, *np.floor(points_b / cell).T])
+    order = np.argsort(keys_b)
+    buckets, bucket_firsts, bucket_counts = np.unique(keys_b[order], return_index=True, return_counts=True)
+
+    candidates_a, candidates_b = [], []
+    low = np.floor((points_a - radius) / cell)
+    high = np.floor((points_a + radius) / cell)
+    for cell_x, cell_y in ((low[:, 0], low[:, 1]), (high[:, 0], low[:, 1]), (low[:, 0], high[:, 1]), (high[:, 0], high[:, 1])):
+        keys = _hash_columns([shapes_a, cell_x, cell_y])
+        # Searching sorted keys walks the buckets in order, which is several times faster
+        key_order = np.argsort(keys)
+        bucket = np.empty(len(keys), dtype=np.intp)
+        bucket[key_order] = np.minimum(np.searchsorted(buckets, keys[key_order]), len(buckets) - 1)
+        first = bucket_firsts[bucket]
+        counts = np.where(buckets[bucket] == keys, bucket_counts[bucket], 0)
+        candidates_a.append(np.repeat(np.arange(len(keys)), counts))
+        candidates_b.append(order[np.repeat(first, counts) + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)])
+    # A point near a cell corner finds the same bucket through several of the corners
+    pairs = np.unique(np.concatenate(candidates_a) * len(points_b) + np.concatenate(candidates_b))
+    candidates_a, candidates_b = np.divmod(pairs, len(points_b))
+    close = np.all(np.abs(points_a[candidates_a] - points_b[candidates_b]) <= radius, axis=1)
+    return candidates_a[close], candidates_b[close]
+
+
+def _assign(candidates_a, candidates_b, distances):
+    """Pairs the candidates one to one, closest first; returns the two index arrays"""
+    # Candidates sharing neither index with another are paired whatever the order, so only the rest need a loop
+    _, index_a, counts_a = np.unique(candidates_a, return_inverse=True, return_counts=True)
+    _, index_b, counts_b = np.unique(candidates_b, return_inverse=True, return_counts=True)
+    alone = (counts_a[index_a] == 1) & (counts_b[index_b] == 1)
+    used_a, used_b = set(), set()
+    pairs_a, pairs_b = [], []
+    contested = np.flatnonzero(~alone)
+    order = contested[np.lexsort((candidates_b[contested], candidates_a[contested], distances[contested]))]
+    for i, j in zip(candidates_a[order].tolist(), candidates_b[order].tolist()):
+        if i not in used_a and j not in used_b:
+            used_a.add(i)
+            used_b.add(j)
+            pairs_a.append(i)
+            pairs_b.append(j)
+    return (np.concatenate([candidates_a[alone], np.array(pairs_a, dtype=np.intp)]),
+            np.concatenate([candidates_b[alone], np.array(pairs_b, dtype=np.intp)]))
+
+
+def _match_near(shapes_a, geometry_a, shapes_b, geometry_b, tolerance):
+    """Pairs nets whose coordinates all lie within tolerance, the closest pairs first"""
+    if len(shapes_a) == 0 or len(shapes_b) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    candidates_a, candidates_b = _candidates(shapes_a, geometry_a[:, :2], shapes_b, geometry_b[:, :2], tolerance)
+    differences = np.abs(geometry_a[candidates_a] - geometry_b[candidates_b]).max(axis=1)
+    close = differences <= tolerance
+    return _assign(candidates_a[close], candidates_b[close], differences[close])
+
+
+def _match_moved(shapes_a, geometry_a, shapes_b, geometry_b, tolerance, max_offset):
+    """Pairs nets with the same shape and geometry relative to their start point, whose starts are at most
+    max_offset apart, the nearest pairs first
+
+    The search radius starts small and doubles up to max_offset, pairing what it can at each step, so nets that
+    moved a little are paired before the candidates of a large radius are ever built.
+    """
+    left_a = np.arange(len(shapes_a))
+    left_b = np.arange(len(shapes_b))
+    pairs_a, pairs_b = [], []
+    radius = max(2 * tolerance, max_offset / 1024)
+    while len(left_a) and len(left_b):
+        radius = min(radius, max_offset)
+        candidates_a, candidates_b = _candidates(shapes_a[left_a], geometry_a[left_a, :2], shapes_b[left_b], geometry_b[left_b, :2], radius)
+        a = left_a[candidates_a]
+        b = left_b[candidates_b]
+        relative_a = geometry_a[a] - np.tile(geometry_a[a, :2], 3)
+        relative_b = geometry_b[b] - np.tile(geometry_b[b, :2], 3)
+        distances = np.hypot(*(geometry_b[b, :2] - geometry_a[a, :2]).T)
+        # Pairs further than radius apart may lose to nearer ones only found with the next radius
+        same = np.all(np.abs(relative_a - relative_b) <= tolerance, axis=1) & (distances <= radius)
+        index_a, index_b = _assign(candidates_a[same], candidates_b[same], distances[same])
+        pairs_a.append(left_a[index_a])
+        pairs_b.append(left_b[index_b])
+        left_a = np.delete(left_a, index_a)
+        left_b = np.delete(left_b, index_b)
+        if radius >= max_offset:
+            break
+        radius *= 2
+    if not pairs_a:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def diff_netlists(columns_a, apertures_a, columns_b, apertures_b, tolerance=1e-6, max_offset=1.0):
+    """Compares two netlists given as netlist_arrays and aperture_arrays; coordinates within tolerance are equal
+
+    Nets are matched by hashing their shape and quantized coordinates on two grids offset by half a cell, which only
+    takes a few sorts of the hashes; the few left over are matched within tolerance through a grid of start points.
+    Nets still unmatched on both sides that have the same shape and the same geometry relative to their start point,
+    and start at most max_offset apart, are reported as moved, each paired with the nearest one. The rest are
+    reported as removed and added.
+    """
+    if not tolerance > 0:
+        raise ValueError('tolerance must be positive')
+    if not max_offset > 0:
+        raise ValueError('max_offset must be positive')
+    nets_a = _drawn(columns_a)
+    nets_b = _drawn(columns_b)
+    shapes_a = _shapes(columns_a, apertures_a, nets_a)
+    shapes_b = _shapes(columns_b, apertures_b, nets_b)
+    geometry_a = _geometry(columns_a, nets_a)
+    geometry_b = _geometry(columns_b, nets_b)
+    left_a = np.arange(len(nets_a))
+    left_b = np.arange(len(nets_b))
+    unchanged = 0
+
+    cell = 2 * tolerance
+    for offset in (0, 0.5):
+        index_a, index_b = _match_quantized(shapes_a[left_a], geometry_a[left_a], shapes_b[left_b], geometry_b[left_b], cell, offset)
+        unchanged += len(index_a)
+        left_a = np.delete(left_a, index_a)
+        left_b = np.delete(left_b, index_b)
+    index_a, index_b = _match_near(shapes_a[left_a], geometry_a[left_a], shapes_b[left_b], geometry_b[left_b], tolerance)
+    unchanged += len(index_a)
+    left_a = np.delete(left_a, index_a)
+    left_b = np.delete(left_b, index_b)
+
+    index_a, index_b = _match_moved(shapes_a[left_a], geometry_a[left_a], shapes_b[left_b], geometry_b[left_b], tolerance, max_offset)
+    moved_a = left_a[index_a]
+    moved_b = left_b[index_b]
+    left_a = np.delete(left_a, index_a)
+    left_b = np.delete(left_b, index_b)
+    offsets = geometry_b[moved_b, :2] - geometry_a[moved_a, :2]
+
+    return DiffResult(
+        added=nets_b[left_b],
+        removed=nets_a[left_a],
+        moved=np.stack([nets_a[moved_a], nets_b[moved_b]], axis=1).reshape(-1, 2),
+        offsets=offsets,
+        unchanged=unchanged,
+    )
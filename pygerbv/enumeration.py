@@ -22,6 +22,13 @@ c_gerbv_selection_t = c_int
 c_gerbv_unit_t = c_int
 
 
+class LayerType(enum.IntEnum):
+    RS274X = 0
+    DRILL = 1
+    PICKANDPLACE_TOP = 2
+    PICKANDPLACE_BOT = 3
+
+
 class ApertureType(enum.IntEnum):
     NONE = 0
     CIRCLE = 1
@@ -43,3 +50,35 @@ class Unit(enum.IntEnum):
     INCH = 0,
     MM = 1,
     UNSPECIFIED = 2
+
+
+class ApertureState(enum.IntEnum):
+    OFF = 0
+    ON = 1
+    FLASH = 2
+
+
+class Interpolation(enum.IntEnum):
+    LINEARx1 = 0
+    LINEARx10 = 1
+    LINEARx01 = 2
+    LINEARx001 = 3
+    CW_CIRCULAR = 4
+    CCW_CIRCULAR = 5
+    PAREA_START = 6
+    PAREA_END = 7
+    DELETED = 8
+
+
+class MessageType(enum.IntEnum):
+    FATAL = 0
+    ERROR = 1
+    WARNING = 2
+    NOTE = 3
+
+
+class Polarity(enum.IntEnum):
+    POSITIVE = 0
+    NEGATIVE = 1
+    DARK = 2
+    CLEAR = 3
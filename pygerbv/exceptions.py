@@ -8,3 +8,11 @@ class GerberFormatError(BaseError):
 
 class GerberNotFoundError(BaseError):
     pass
+
+
+class RenderError(BaseError):
+    pass
+
+
+class LibraryNotFoundError(BaseError, ModuleNotFoundError):
+    pass
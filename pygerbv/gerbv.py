@@ -1,22 +1,153 @@
 # encoding: utf-8
 
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from ctypes import *
-from ctypes.util import find_library
-import platform
+import hashlib
+import os
+import re
+import shutil
 import tempfile
+import threading
+import weakref
 
+import numpy as np
+
+from .apertures import ApertureTable, transform_apertures
+from .area import Grid, aperture_arrays, copper_area, density_grid, polarity_signs
+from .diff import diff_netlists
 from .exceptions import *
 from .enumeration import *
+from .library import Library
+from .netlist import NET_COLUMNS, Net, NetFilter, cirseg_columns, iter_read_nets, netlist_arrays, read_nets, remap_apertures, small_nets, transform_box, transform_netlist, write_nets
+from .render import render_to_array
+from .spatial import GridIndex
+from .stats import drill_stats, gerber_stats, is_empty
+from .transform import is_rigid, transform_projects
+from .writer import GerberWriter
 from .structure import *
 
 
-library_path = find_library('gerbv')
-if not library_path:
-    raise ModuleNotFoundError
-if platform.system() == 'Linux':
-    _libgerbv = CDLL('/usr/local/lib/' + library_path)
-else:
-    _libgerbv = CDLL(library_path)
+_libgerbv = Library('gerbv', 'PYGERBV_LIBRARY')
+
+
+@contextmanager
+def _anonymous_file(name):
+    """Yields a binary file and a path that libgerbv can open it by
+
+    On Linux the file is a memfd and never touches the filesystem; elsewhere a temporary file is used.
+    """
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create(name)
+        with open(fd, 'w+b') as f:
+            yield f, '/proc/self/fd/{}'.format(fd)
+    else:
+        f = tempfile.NamedTemporaryFile(prefix=name, delete=False)
+        try:
+            with f:
+                yield f, f.name
+        finally:
+            os.unlink(f.name)
+
+
+# Number of native objects owned by pygerbv, i.e. that pygerbv has to destroy, by kind
+_live_objects = Counter()
+# Objects are created on worker threads and finalizers run on whichever thread collects them
+_live_objects_lock = threading.Lock()
+
+
+def live_native_objects():
+    """Returns how many native projects and images owned by pygerbv are alive"""
+    with _live_objects_lock:
+        return {'project': _live_objects['project'], 'image': _live_objects['image']}
+
+
+def _count(kind, delta):
+    with _live_objects_lock:
+        _live_objects[kind] += delta
+
+
+def _track(kind, destroy, obj, native):
+    """Counts native as a live object and destroys it once obj is garbage collected, unless closed earlier"""
+    _count(kind, 1)
+    finalizer = weakref.finalize(obj, _destroy, kind, destroy, native)
+    # Do not spend time tearing down native objects at interpreter exit; the OS reclaims them anyway
+    finalizer.atexit = False
+    return finalizer
+
+
+def _destroy(kind, destroy, native):
+    destroy(native)
+    _count(kind, -1)
+
+
+# Parameters that libgerbv's RS-274X parser keeps in static variables: knockout and image transformations
+_STATIC_STATE_PARAMETERS = re.compile(rb'[%*]\s*(?:KO|IR|OF|SF)')
+
+
+def _uses_static_state(data):
+    """Returns whether the contents of a file may set static parser state; None stands for unknown contents"""
+    return data is None or _STATIC_STATE_PARAMETERS.search(data) is not None
+
+
+def _source_digest(data):
+    """Returns the SHA-256 hex digest of the contents of a file, as LayerCache.key does, or None for unknown contents"""
+    return hashlib.sha256(data).hexdigest() if data is not None else None
+
+
+def _read_file(filename):
+    """Returns the contents of a file about to be parsed, or None if it cannot be read, which libgerbv reports itself"""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class _ParserLock:
+    """Lets any number of parses run at once, except those that use libgerbv's static parser state, which run alone"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive and self._shared == 0)
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+_parser_lock = _ParserLock()
+
+
+def _transform_state(transform):
+    return (transform.translateX, transform.translateY, transform.scaleX, transform.scaleY, transform.rotation,
+            bool(transform.mirrorAroundX), bool(transform.mirrorAroundY), bool(transform.inverted))
+
+
+# Smallest layer libgerbv accepts: it refuses images without any net
+_PLACEHOLDER_LAYER = b'%FSLAX24Y24*%\n%MOIN*%\n%ADD10C,0.001*%\nD10*\nX0Y0D03*\nM02*\n'
 
 
 class Aperture:
@@ -55,34 +186,144 @@ class Aperture:
 
 
 class Image:
-    _libgerbv.gerbv_image_create_line_object.argtypes = [POINTER(GerbvImage), c_double, c_double, c_double, c_double, c_double, c_gerbv_aperture_type_t]
-    _libgerbv.gerbv_create_image.argtypes = [POINTER(GerbvImage), c_char_p]
-    _libgerbv.gerbv_create_image.restype = POINTER(GerbvImage)
-    _libgerbv.gerbv_export_rs274x_file_from_image.restype = c_bool
-    _libgerbv.gerbv_export_rs274x_file_from_image.argtypes = [c_char_p, POINTER(GerbvImage), POINTER(GerbvUserTransformation)]
-    _libgerbv.gerbv_image_duplicate_image.argtypes = [POINTER(GerbvImage), POINTER(GerbvUserTransformation)]
-    _libgerbv.gerbv_image_duplicate_image.restype = POINTER(GerbvImage)
-    _libgerbv.gerbv_image_copy_image.argtypes = [POINTER(GerbvImage), POINTER(GerbvUserTransformation), POINTER(GerbvImage)]
+    _libgerbv.prototype('gerbv_image_create_line_object', [POINTER(GerbvImage), c_double, c_double, c_double, c_double, c_double, c_gerbv_aperture_type_t])
+    _libgerbv.prototype('gerbv_create_image', [POINTER(GerbvImage), c_char_p], restype=POINTER(GerbvImage))
+    _libgerbv.prototype('gerbv_export_rs274x_file_from_image', [c_char_p, POINTER(GerbvImage), POINTER(GerbvUserTransformation)], restype=c_bool)
+    _libgerbv.prototype('gerbv_image_duplicate_image', [POINTER(GerbvImage), POINTER(GerbvUserTransformation)], restype=POINTER(GerbvImage))
+    _libgerbv.prototype('gerbv_image_copy_image', [POINTER(GerbvImage), POINTER(GerbvUserTransformation), POINTER(GerbvImage)])
+    _libgerbv.prototype('gerbv_destroy_image', [POINTER(GerbvImage)])
+    _libgerbv.prototype('gerbv_render_layer_to_cairo_target', [c_void_p, POINTER(GerbvFileInfo), POINTER(GerbvRenderInfo)])
+    # GLib comes with libgerbv, and frees what libgerbv allocated
+    _libgerbv.prototype('g_free', [c_void_p])
+
+
+    def __init__(self, image, on_change=None, owned=False):
+        """Wraps a native image; if owned, the image is destroyed with this object instead of with a project"""
+        self._image = image
+        self._on_change = on_change
+        self._finalizer = _track('image', _libgerbv.gerbv_destroy_image, self, image) if owned else None
+        self._apertures = None
+        self._aperture_table = None
+        self._digest = None
+        self._netlist_arrays = None
+        self._spatial_index = None
+        # libgerbv's parse statistics describe the nets until pygerbv modifies the image
+        self._stats_current = True
+        # Statistics of the parse an image from a LayerCache was duplicated from: {LayerType: stats}
+        self._cached_stats = None
+        # SHA-256 hex digest of the file the image was parsed from, where known, until pygerbv modifies the image
+        self._source_digest = None
+
+    @classmethod
+    def from_filename(cls, filename):
+        """Parses a Gerber or Excellon file into a standalone image, owned by the returned object"""
+        with Project() as project:
+            file_info = project._open_file(filename, exclusive=True)
+            # Take the parsed image out of the project and leave an empty one to be destroyed in its place
+            image = file_info.image
+            file_info.image = _libgerbv.gerbv_create_image(None, b'rs274-x')
+        return cls(image, owned=True)
 
+    @classmethod
+    def from_bytes(cls, data, name='layer'):
+        with _anonymous_file(name) as (f, path):
+            f.write(data)
+            f.flush()
+            return cls.from_filename(path)
 
-    def __init__(self, image):
-        self._image = image
-        aperture_ids = set()
-        net = image.contents.netlist.contents
-        while(net.next):
-            net = net.next.contents
-            aperture_ids.add(net.aperture)
-        self._apertures = [(aperture_id, Aperture(image.contents.aperture[aperture_id].contents)) for aperture_id in aperture_ids if aperture_id >= 10]
+    @classmethod
+    def from_fileobj(cls, fileobj, name='layer'):
+        """Parses a binary file-like object, read from its current position, into a standalone image"""
+        with _anonymous_file(name) as (f, path):
+            shutil.copyfileobj(fileobj, f)
+            f.flush()
+            return cls.from_filename(path)
+
+    def _changed(self):
+        self._apertures = None
+        self._aperture_table = None
+        self._digest = None
+        self._source_digest = None
+        self._netlist_arrays = None
+        self._spatial_index = None
+        self._stats_current = False
+        if self._on_change is not None:
+            self._on_change()
+
+    def _used_aperture_ids(self):
+        if self._stats_current:
+            aperture_ids = set()
+            stats = self._image.contents.gerbv_stats
+            entry = stats.contents.D_code_list if stats else None
+            while entry:
+                if entry.contents.count > 0:
+                    aperture_ids.add(entry.contents.number)
+                entry = entry.contents.next
+            if aperture_ids:
+                return aperture_ids
+        # Images built or modified outside the parser have no usable D code statistics, so look at the nets
+        if self._netlist_arrays is not None:
+            apertures = self._netlist_arrays['aperture']
+        else:
+            apertures = read_nets(self._image.contents.netlist)[0]['aperture']
+        return set(np.unique(apertures).tolist())
 
     @property
     def apertures(self):
+        """Returns (aperture_id, Aperture) for every aperture used by the nets, discovered on first access
+
+        Every Aperture holds a copy of the native aperture, so it stays readable after the image changes;
+        set apertures to write changes back.
+        """
+        if self._apertures is None:
+            aperture_ids = sorted(self._used_aperture_ids())
+            self._apertures = [(aperture_id, Aperture(GerbvAperture.from_buffer_copy(self._image.contents.aperture[aperture_id].contents))) for aperture_id in aperture_ids if APERTURE_MIN <= aperture_id < APERTURE_MAX and self._image.contents.aperture[aperture_id]]
         return self._apertures
 
     @apertures.setter
     def apertures(self, apertures):
-        self._apertures = apertures
         for aperture_id, aperture in apertures:
-            self._image.contents.aperture[aperture_id].contents = GerbvAperture(aperture.type, aperture.amacro, aperture.simplified, aperture.parameter, aperture.nuf_parameters, aperture.unit)
+            slot = self._image.contents.aperture[aperture_id]
+            if not slot:
+                raise ValueError('Aperture D{} is not defined'.format(aperture_id))
+            # Copy into the native aperture, which libgerbv frees with the image
+            slot[0] = GerbvAperture(aperture.type, aperture.amacro, aperture.simplified, aperture.parameter, aperture.nuf_parameters, aperture.unit)
+        self._changed()
+        self._apertures = apertures
+
+    def _parser_stats(self, layer_type, stats, build):
+        if not self._stats_current:
+            return None
+        if self._cached_stats is not None:
+            return self._cached_stats.get(layer_type)
+        # libgerbv allocates both kinds of statistics for every image, parsed or not, so only trust filled ones
+        if self._image.contents.layertype != layer_type or not stats:
+            return None
+        stats = build(stats.contents)
+        return None if is_empty(stats) else stats
+
+    @property
+    def stats(self):
+        """Returns the Gerber parser statistics as GerberStats
+
+        Returns None unless the image was parsed from a Gerber file and not modified since, e.g. for drill layers,
+        panelized images and images built with create_line_objects.
+        """
+        return self._parser_stats(LayerType.RS274X, self._image.contents.gerbv_stats, gerber_stats)
+
+    @property
+    def drill_stats(self):
+        """Returns the Excellon parser statistics as DrillStats, or None unless the image was parsed from a drill file"""
+        return self._parser_stats(LayerType.DRILL, self._image.contents.drill_stats, drill_stats)
+
+    @property
+    def parse_messages(self):
+        """Returns the errors, warnings and notes of the Gerber and Excellon parsers as (layer, type, text) tuples"""
+        messages = []
+        for stats in (self.stats, self.drill_stats):
+            if stats is not None:
+                messages.extend(stats.messages)
+        return messages
 
     @property
     def min_x(self):
@@ -100,18 +341,306 @@ class Image:
     def max_y(self):
         return self._image.contents.info.contents.max_y
 
+    def aperture_table(self):
+        """Returns every defined aperture as an ApertureTable, read once and cached until the image is modified"""
+        if self._aperture_table is None:
+            self._aperture_table = ApertureTable.from_image(self._image)
+        return self._aperture_table
+
+    def dedupe_apertures(self):
+        """Merges equivalent apertures into the one with the lowest D code and frees the others
+
+        Nets using a merged aperture are remapped with one pass over the netlist.
+        Returns {removed D code: D code now used instead}. Aperture objects read from apertures earlier are copies;
+        those of removed D codes describe apertures that no longer exist and must not be set back.
+        """
+        duplicates = self.aperture_table().duplicates()
+        if not duplicates:
+            return duplicates
+        remap = np.arange(APERTURE_MAX, dtype=np.intc)
+        remap[list(duplicates)] = list(duplicates.values())
+        remap_apertures(self._image.contents.netlist, remap)
+
+        slots = self._image.contents.aperture
+        for number in duplicates:
+            aperture = slots[number]
+            simplified = aperture.contents.simplified
+            while simplified:
+                following = simplified.contents.next
+                _libgerbv.g_free(simplified)
+                simplified = following
+            _libgerbv.g_free(aperture)
+            slots[number] = None
+        self._changed()
+        return duplicates
+
+    def netlist_arrays(self):
+        """Returns the nets as a dict of column arrays
+
+        Columns are start_x, start_y, stop_x, stop_y, the bounding box (left, right, bottom, top), aperture,
+        aperture_state, interpolation, the cirseg parameters of arcs (cp_x, cp_y, cirseg_width, cirseg_height,
+        angle1, angle2; NaN for other nets), the native address of each net's layer and of the net itself.
+        The netlist is walked once and the result is cached until the image is modified.
+        The walk is a Python loop over the linked list costing roughly 2 us per net, so the first call on a
+        large image is no faster than iterating the nets; only the cached columns are cheap.
+        """
+        if self._netlist_arrays is None:
+            self._netlist_arrays = netlist_arrays(self._image.contents.netlist)
+        return self._netlist_arrays
+
+    def digest(self):
+        """Returns a SHA-256 hex digest of the nets, their polarity and the apertures, cached like netlist_arrays
+
+        Images with equal digests draw the same, wherever they were loaded from.
+        """
+        if self._digest is None:
+            columns = self.netlist_arrays()
+            table = self.aperture_table()
+            digest = hashlib.sha256()
+            # Native addresses differ from one load to the next, so only values go into the digest
+            for name, values in columns.items():
+                if name not in ('address', 'layer'):
+                    digest.update(values.tobytes())
+            digest.update(polarity_signs(columns['layer']).tobytes())
+            for values in (table.numbers, table.types, table.units, table.offsets, table.parameters):
+                digest.update(values.tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def _content_key(self):
+        """Returns a key of what the image draws: the digest of its source file if known, without walking the nets"""
+        if self._source_digest is not None:
+            return 'source', self._source_digest
+        return 'image', self.digest()
+
+    @contextmanager
+    def _hidden_small_nets(self, min_size):
+        """Marks the nets smaller than min_size inches deleted, so libgerbv skips them, and restores them on exit"""
+        records, addresses = read_nets(self._image.contents.netlist)
+        small = small_nets(records, min_size)
+        original = records[small]
+        hidden = original.copy()
+        hidden['interpolation'] = Interpolation.DELETED
+        write_nets(hidden, addresses[small])
+        try:
+            yield
+        finally:
+            write_nets(original, addresses[small])
+
+    def iter_nets(self, filter=None, chunk_size=None, batch_size=4096):
+        """Walks the netlist lazily and yields the nets that pass filter, a NetFilter
+
+        Yields a Net per net, or with chunk_size, dicts of column arrays like netlist_arrays holding chunk_size
+        nets each (the last one fewer). The netlist is copied batch_size nodes at a time and every batch is filtered
+        as a whole before anything is built for it, so stopping early skips the rest of the walk, and nets that do not
+        pass cost no Python objects. E.g. the flashes of D12:
+
+            image.iter_nets(NetFilter(apertures=[12], aperture_states=[ApertureState.FLASH]))
+
+        The image must not be modified until the iteration ends.
+        """
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('chunk_size must be positive')
+        pending = []
+        pending_count = 0
+        for records, addresses in iter_read_nets(self._image.contents.netlist, batch_size):
+            if filter is not None:
+                keep = filter.mask(records)
+                records = records[keep]
+                addresses = addresses[keep]
+            if len(records) == 0:
+                continue
+            columns = {name: np.ascontiguousarray(records[name]) for name in NET_COLUMNS}
+            columns['address'] = addresses
+            columns.update(cirseg_columns(records))
+            if chunk_size is None:
+                for values in zip(*(columns[name].tolist() for name in Net.__slots__)):
+                    yield Net(*values)
+                continue
+            pending.append(columns)
+            pending_count += len(records)
+            if pending_count >= chunk_size:
+                # Merge once, then hand out slices of the merged arrays; only the remainder is carried over
+                merged = {name: np.concatenate([chunk[name] for chunk in pending]) for name in pending[0]}
+                offset = 0
+                while pending_count - offset >= chunk_size:
+                    yield {name: values[offset:offset + chunk_size] for name, values in merged.items()}
+                    offset += chunk_size
+                pending = [{name: values[offset:] for name, values in merged.items()}]
+                pending_count -= offset
+        if chunk_size is not None and pending_count:
+            yield {name: np.concatenate([chunk[name] for chunk in pending]) for name in pending[0]}
+
+    def spatial_index(self):
+        """Returns a GridIndex over the bounding boxes of the drawn nets, built once and cached like netlist_arrays"""
+        if self._spatial_index is None:
+            self._spatial_index = GridIndex.from_netlist(self.netlist_arrays())
+        return self._spatial_index
+
+    def query_region(self, x1, y1, x2, y2):
+        """Returns the indices, into netlist_arrays, of the nets whose bounding box intersects the rectangle"""
+        return self.spatial_index().query(x1, y1, x2, y2)
+
+    def nearest_nets(self, x, y, k=1):
+        """Returns the indices, into netlist_arrays, of the k nets nearest to the point and their distances
+
+        The distance to a net is the distance to its bounding box, so it is 0 for every net whose box contains the point.
+        """
+        return self.spatial_index().nearest(x, y, k)
+
+    def diff(self, other, tolerance=1e-6, max_offset=1.0):
+        """Compares the nets of this image (the old revision) with those of other (the new one)
+
+        Returns a DiffResult whose indices refer to netlist_arrays of each image. Nets match when their aperture
+        shape, state, interpolation and coordinates agree within tolerance inches; the aperture D codes may differ.
+        Only nets that moved by at most max_offset inches are reported as moved, each paired with the nearest one.
+        """
+        return diff_netlists(self.netlist_arrays(), aperture_arrays(self._image),
+                             other.netlist_arrays(), aperture_arrays(other._image), tolerance, max_offset)
+
+    def copper_area(self, method='analytic', dpi=1000):
+        """Returns the area covered by the image in square inches
+
+        The analytic method sums the areas of flashes, strokes and regions computed from the netlist, subtracting
+        clear (LPC) layers; overlapping primitives are counted once each, so it overestimates overlapping copper.
+        The raster method renders the image at dpi in strips and counts covered pixels, which measures the union.
+        """
+        if method == 'analytic':
+            return copper_area(self.netlist_arrays(), *aperture_arrays(self._image))
+        elif method == 'raster':
+            pixel_area = 1 / dpi ** 2
+            return sum(int(alpha.sum(dtype=np.int64)) / 255 * pixel_area for _, alpha in self._render_coverage(self._bounds(), dpi))
+        raise ValueError('Unknown method: {}'.format(method))
+
+    def density_grid(self, cell_size, method='analytic', supersample=8):
+        """Returns the fraction of every cell_size x cell_size inch cell covered by the image, and the grid origin
+
+        The grid starts at the lower left corner of the image; row 0 is the bottom row.
+        The analytic method works from the netlist like copper_area, clipped to [0, 1] per cell.
+        The raster method renders supersample x supersample pixels per cell and averages them.
+        """
+        left, bottom, right, top = self._bounds()
+        grid = Grid.covering(left, bottom, right, top, cell_size)
+        if method == 'analytic':
+            return density_grid(self.netlist_arrays(), *aperture_arrays(self._image), grid), grid.origin
+        elif method == 'raster':
+            rows, columns = grid.shape
+            bounds = (left, bottom, left + columns * cell_size, bottom + rows * cell_size)
+            density = np.zeros(grid.shape)
+            for y, alpha in self._render_coverage(bounds, supersample / cell_size, supersample):
+                cells = alpha.reshape(-1, supersample, columns, supersample).mean(axis=(1, 3), dtype=np.float32) / 255
+                # Pixel rows go down from the top while grid rows go up from the bottom
+                density[rows - y // supersample - len(cells):rows - y // supersample] = cells[::-1]
+            return density, grid.origin
+        raise ValueError('Unknown method: {}'.format(method))
+
+    def _bounds(self):
+        info = self._image.contents.info.contents
+        if not all(np.isfinite([info.min_x, info.min_y, info.max_x, info.max_y])) or info.min_x > info.max_x:
+            return 0.0, 0.0, 0.0, 0.0
+        return info.min_x, info.min_y, info.max_x, info.max_y
+
+    def _render_coverage(self, bounds, dpi, row_multiple=1, strip_pixels=16 * 1024 * 1024):
+        """Renders the image alone and yields (y, alpha) for horizontal strips, top strip first
+
+        alpha is a uint8 view of the alpha of each pixel, 255 where fully covered; y is the first pixel row of the strip.
+        Strips hold about strip_pixels pixels (4 bytes each) whatever the width, and their heights are multiples of
+        row_multiple.
+        """
+        left, bottom, right, top = bounds
+        width = max(int(round((right - left) * dpi)), 1)
+        height = max(int(round((top - bottom) * dpi)), 1)
+        strip_height = max(strip_pixels // width // row_multiple, 1) * row_multiple
+        file_info = GerbvFileInfo()
+        file_info.image = self._image
+        file_info.color = GdkColor(0, 65535, 65535, 65535)
+        file_info.alpha = 65535
+        file_info.isVisible = True
+        file_info.transform = GerbvUserTransformation(0, 0, 1, 1, 0, False, False, False)
+        for y in range(0, height, strip_height):
+            rows = min(strip_height, height - y)
+            render_info = GerbvRenderInfo(dpi, dpi, left, bottom + (height - y - rows) / dpi, 3, width, rows)
+            array = render_to_array(
+                lambda cr: _libgerbv.gerbv_render_layer_to_cairo_target(cr, byref(file_info), byref(render_info)),
+                width,
+                rows
+            )
+            yield y, array[:, :, 3]
+
+    def transform(self, matrix):
+        """Moves the geometry of the image by a rigid 2x3 or 3x3 affine transformation, in place
+
+        Net coordinates and arcs are transformed with vectorized operations, and apertures are turned and mirrored
+        along with them as far as gerbv can describe it; see transform_apertures. Raises ValueError, leaving the
+        image untouched, if an aperture cannot follow.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)[:2]
+        if not is_rigid(matrix):
+            raise ValueError('Only rigid transformations can be baked into the image geometry')
+        transform_apertures(self._image, matrix)
+        transform_netlist(self._image.contents.netlist, matrix)
+        info = self._image.contents.info.contents
+        if all(np.isfinite([info.min_x, info.min_y, info.max_x, info.max_y])):
+            info.min_x, info.min_y, info.max_x, info.max_y = transform_box(matrix, info.min_x, info.min_y, info.max_x, info.max_y)
+        self._changed()
+
     def create_line_object(self, start_x, start_y, end_x, end_y, line_width, aperture_type):
         _libgerbv.gerbv_image_create_line_object(self._image, start_x, start_y, end_x, end_y, line_width, aperture_type)
-
-    def panelize(self, positions, rotation=0, translate=(0, 0)):
+        self._changed()
+
+    def create_line_objects(self, starts, ends, widths, aperture_type=ApertureType.CIRCLE):
+        """Adds a line from every start to the matching end, in a single native pass
+
+        starts and ends are (n, 2) arrays and widths one width or one per line, all in inches. aperture_type is
+        CIRCLE or RECTANGLE (a square of the line width), like create_line_object. The lines are written as RS-274X
+        with one aperture per distinct width, parsed, and copied into this image, where apertures that match
+        existing ones are reused.
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        if len(starts) != len(ends):
+            raise ValueError('starts and ends must have the same length')
+        if len(starts) == 0:
+            return
+        if aperture_type not in (ApertureType.CIRCLE, ApertureType.RECTANGLE):
+            raise ValueError('Lines can only be drawn with circle or rectangle apertures')
+        widths, apertures = np.unique(np.broadcast_to(np.asarray(widths, dtype=np.float64), (len(starts),)), return_inverse=True)
+        with _anonymous_file('lines') as (f, path):
+            writer = GerberWriter(f)
+            parameters = [(width,) if aperture_type == ApertureType.CIRCLE else (width, width) for width in widths.tolist()]
+            numbers = np.array([writer.add_aperture(aperture_type, *p) for p in parameters])
+            writer.lines(starts, ends, numbers[apertures])
+            writer.close()
+            with Image.from_filename(path) as source:
+                _libgerbv.gerbv_image_copy_image(source._image, GerbvUserTransformation(0, 0, 1, 1, 0, False, False, False), self._image)
+
+        # Grow the image extents by the new lines, so the project bounding box includes them
+        margins = widths[apertures, None] / 2
+        low = (np.minimum(starts, ends) - margins).min(axis=0)
+        high = (np.maximum(starts, ends) + margins).max(axis=0)
+        info = self._image.contents.info.contents
+        info.min_x = min(info.min_x, float(low[0]))
+        info.min_y = min(info.min_y, float(low[1]))
+        info.max_x = max(info.max_x, float(high[0]))
+        info.max_y = max(info.max_y, float(high[1]))
+        self._changed()
+
+    def panelize(self, positions, rotation=0, translate=(0, 0), in_memory=True):
+        """Replaces the image by copies of itself placed at every position
+
+        The copies are made from gerbv_image_duplicate_image, the same copy LayerCache hands out. With in_memory
+        False they are made from a reparse of the image written to an anonymous file instead, as older versions
+        did to work around gerbv crashing on a direct copy of a parsed image.
+        """
         new_image = _libgerbv.gerbv_create_image(None, b'rs274-x')
-        p = Project()
-        # FIXME: 単純にimageをcopyするとgerbv側でメモリ関連のエラーが出る
-        # そのため現在のimageをファイルに書き出してからそれをもう一度読み直す手順にしている
-        # できれば効率よくしたいけども...
-        with tempfile.NamedTemporaryFile() as f:
-            self.export_rs274x_file(f.name, None)
-            file_info = p.open_layer_from_filename(f.name)
+        if in_memory:
+            identity = GerbvUserTransformation(0, 0, 1, 1, 0, False, False, False)
+            source = Image(_libgerbv.gerbv_image_duplicate_image(self._image, identity), owned=True)
+        else:
+            with _anonymous_file('panelize') as (_, path):
+                self.export_rs274x_file(path, None)
+                source = Image.from_filename(path)
+        with source:
             for x, y in positions:
                 t = GerbvUserTransformation(
                     x + translate[0],
@@ -123,17 +652,40 @@ class Image:
                     False,
                     False
                 )
-                _libgerbv.gerbv_image_copy_image(file_info.image._image, t, new_image)
+                _libgerbv.gerbv_image_copy_image(source._image, t, new_image)
+        # The old image is destroyed here if this object owns it, or with its project otherwise
+        self.close()
         self._image = new_image
+        self._finalizer = _track('image', _libgerbv.gerbv_destroy_image, self, new_image)
+        self._changed()
 
     def export_rs274x_file(self, filename, transformation):
         return _libgerbv.gerbv_export_rs274x_file_from_image(filename.encode('utf-8'), self._image, transformation)
 
+    def close(self):
+        """Destroys the native image if this object owns it; images of a layer are destroyed with their project"""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._image = None
+        self._aperture_table = None
+        self._digest = None
+        self._source_digest = None
+        self._netlist_arrays = None
+        self._spatial_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 class FileInfo:
-    def __init__(self, file_info):
+    def __init__(self, file_info, project=None):
         self._file_info = file_info
-        self.image = Image(self._file_info.image)
+        self._project = project
+        self.image = Image(self._file_info.image, on_change=self._changed)
         self._color = None
         self.color = (0, 0, 0, 0)
         self._alpha = None
@@ -170,20 +722,39 @@ class FileInfo:
         self._file_info.isVisible = is_visible
         self._is_visible = is_visible
 
+    def _changed(self):
+        if self._project is not None:
+            self._project._invalidate_bounding_box()
+
     def translate(self, x, y):
         self._file_info.transform.translateX += x
         self._file_info.transform.translateY += y
+        self._changed()
 
     def scale(self, x, y):
         self._file_info.transform.scaleX *= x
         self._file_info.transform.scaleY *= y
+        self._changed()
 
     def rotate(self, theta):
         self._file_info.transform.rotation += theta
+        self._changed()
 
     def mirror(self, x, y):
         self._file_info.transform.mirrorAroundX = x
         self._file_info.transform.mirrorAroundY = y
+        self._changed()
+
+    def _set_transform(self, translate_x, translate_y, scale_x, scale_y, rotation, mirror_around_x):
+        transform = self._file_info.transform
+        transform.translateX = translate_x
+        transform.translateY = translate_y
+        transform.scaleX = scale_x
+        transform.scaleY = scale_y
+        transform.rotation = rotation
+        transform.mirrorAroundX = bool(mirror_around_x)
+        transform.mirrorAroundY = False
+        self._changed()
 
     @property
     def inverted(self):
@@ -196,20 +767,26 @@ class FileInfo:
 
 
 class Project:
-    _libgerbv.gerbv_create_project.restype = POINTER(GerbvProject)
-    _libgerbv.gerbv_open_layer_from_filename.argtypes = [POINTER(GerbvProject), c_char_p]
-    _libgerbv.gerbv_export_pdf_file_from_project.argtypes = [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p]
-    _libgerbv.gerbv_export_png_file_from_project.argtypes = [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p]
-    _libgerbv.gerbv_export_svg_file_from_project.argtypes = [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p]
-    _libgerbv.gerbv_render_get_boundingbox.argtypes = [POINTER(GerbvProject), POINTER(GerbvRenderSize)]
-
-    def __init__(self):
+    _libgerbv.prototype('gerbv_create_project', restype=POINTER(GerbvProject))
+    _libgerbv.prototype('gerbv_destroy_project', [POINTER(GerbvProject)])
+    _libgerbv.prototype('gerbv_open_layer_from_filename', [POINTER(GerbvProject), c_char_p])
+    _libgerbv.prototype('gerbv_export_pdf_file_from_project', [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p])
+    _libgerbv.prototype('gerbv_export_png_file_from_project', [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p])
+    _libgerbv.prototype('gerbv_export_svg_file_from_project', [POINTER(GerbvProject), POINTER(GerbvRenderInfo), c_char_p])
+    _libgerbv.prototype('gerbv_render_get_boundingbox', [POINTER(GerbvProject), POINTER(GerbvRenderSize)])
+    _libgerbv.prototype('gerbv_render_all_layers_to_cairo_target', [POINTER(GerbvProject), c_void_p, POINTER(GerbvRenderInfo)])
+    _libgerbv.prototype('g_strdup', [c_char_p], restype=c_void_p)
+
+    def __init__(self, layer_cache=None):
         self._project = _libgerbv.gerbv_create_project()[0]
+        self._finalizer = _track('project', _libgerbv.gerbv_destroy_project, self, self._project)
+        self.layer_cache = layer_cache
         self._background = None
         self.background = (0, 1, 1, 1)
         self.file = []
         self.margin = 0.001
         self._bounding_box = GerbvRenderSize(0, 0, 0, 0)
+        self._bounding_box_valid = False
 
     @property
     def background(self):
@@ -222,7 +799,12 @@ class Project:
 
     @property
     def bounding_box(self):
-        bb = self._bounding_box
+        """Returns the bounding box of all layers
+
+        The result is cached until a layer is opened, transformed or its image is modified.
+        """
+        if self._bounding_box_valid:
+            return self._bounding_box
         layer_visibilities = []
         # Make all layers visible once to get a consistent bounding box regardless the visibilities of layers
         for layer in self.file:
@@ -233,15 +815,170 @@ class Project:
         # Set visibilities again
         for i, layer in enumerate(self.file):
             layer.is_visible = layer_visibilities[i]
+        self._bounding_box_valid = True
         return self._bounding_box
 
+    def _invalidate_bounding_box(self):
+        self._bounding_box_valid = False
+
     def open_layer_from_filename(self, filename):
+        return self._open_layer_from_filename(filename, concurrent=False)
+
+    def _open_layer_from_filename(self, filename, concurrent):
+        """Opens a layer; with concurrent, the file is read up front so its parse may run alongside others
+
+        Otherwise the file is only read when there is a layer cache to key, and parsed while no other parse runs.
+        """
+        if self.layer_cache is None:
+            data = _read_file(filename) if concurrent else None
+            return self._add_file_info(self._open_file(filename, _uses_static_state(data)), _source_digest(data))
+        with open(filename, 'rb') as f:
+            data = f.read()
+        return self._open_cached(data, lambda: self._open_file(filename, _uses_static_state(data)))
+
+    def open_layer_from_bytes(self, data, name='layer'):
+        """Opens a layer from the contents of a Gerber or Excellon file"""
+        if self.layer_cache is None:
+            return self._add_file_info(self._open_bytes(data, name), _source_digest(data))
+        return self._open_cached(data, lambda: self._open_bytes(data, name))
+
+    def open_layer_from_fileobj(self, fileobj, name='layer'):
+        """Opens a layer from a binary file-like object, read from its current position"""
+        return self._open_layer_from_fileobj(fileobj, name, concurrent=False)
+
+    def _open_layer_from_fileobj(self, fileobj, name, concurrent):
+        if concurrent or self.layer_cache is not None:
+            return self.open_layer_from_bytes(fileobj.read(), name)
+        with _anonymous_file(name) as (f, path):
+            shutil.copyfileobj(fileobj, f)
+            f.flush()
+            return self._add_file_info(self._open_file(path, exclusive=True))
+
+    def open_layers(self, filenames, workers=None):
+        """Opens several layers at once, parsing the files in parallel threads
+
+        Layers are added in the order of filenames. Returns, for every file, its FileInfo or the exception raised
+        while opening it, so one bad file does not prevent the others from loading.
+        ctypes releases the GIL while libgerbv parses. libgerbv keeps the state of knockout (%KO) and image
+        transformations (%IR, %OF, %SF) in static variables, so every file is read once up front, for the layer
+        cache key as well, and those using them are parsed while no other parse runs, here or on any other thread.
+        """
+        filenames = list(filenames)
+        if workers is None:
+            workers = min(len(filenames), os.cpu_count() or 1)
+
+        def parse(filename):
+            if self.layer_cache is not None:
+                with open(filename, 'rb') as f:
+                    data = f.read()
+                key = self.layer_cache.key(data)
+                layer = self.layer_cache.get_layer(key)
+                if layer is not None:
+                    return layer, None, key
+            else:
+                data = _read_file(filename)
+                key = _source_digest(data)
+            # Every file is parsed in a project of its own, then its layer is moved into this one
+            scratch = Project()
+            try:
+                scratch._open_file(filename, _uses_static_state(data))
+            except BaseException:
+                scratch.close()
+                raise
+            return None, scratch, key
+
+        results = []
+        with ThreadPoolExecutor(max(workers, 1)) as executor:
+            for future in [executor.submit(parse, filename) for filename in filenames]:
+                try:
+                    layer, scratch, key = future.result()
+                except Exception as e:
+                    results.append(e)
+                    continue
+                if layer is not None:
+                    results.append(self._open_cached_layer(layer, key))
+                    continue
+                with scratch:
+                    file_info = self._adopt_file_info(scratch)
+                if self.layer_cache is not None:
+                    self._cache_layer(key, file_info)
+                results.append(self._add_file_info(file_info, key))
+        return results
+
+    def _adopt_file_info(self, project):
+        """Moves the first layer of another project, with its name and image, into this project"""
+        placeholder = self._open_bytes(_PLACEHOLDER_LAYER, 'placeholder', exclusive=False)
+        index = self._project.last_loaded
+        files = cast(self._project.file, POINTER(c_void_p))
+        project_files = cast(project._project.file, POINTER(c_void_p))
+        adopted = project._project.file[0].contents
+        # Keep the color this project assigned to the slot, as if the file had been opened here
+        adopted.color = placeholder.color
+        adopted.alpha = placeholder.alpha
+        # Swap the two layers, so the placeholder is destroyed with the other project
+        files[index], project_files[0] = project_files[0], files[index]
+        return self._project.file[index].contents
+
+    def _open_file(self, filename, exclusive):
+        """Parses a file into a new layer; exclusive parses run while no other parse runs
+
+        Parses may run on several threads at once (open_layers, aio), which only files using static state disturb,
+        so exclusive must be set unless the file is known not to use any.
+        """
         files_loaded = self.files_loaded()
-        _libgerbv.gerbv_open_layer_from_filename(self._project, filename.encode('utf-8'))
+        with _parser_lock.exclusive() if exclusive else _parser_lock.shared():
+            _libgerbv.gerbv_open_layer_from_filename(self._project, filename.encode('utf-8'))
         if self.files_loaded() == files_loaded:
             raise GerberFormatError
-        file_info = FileInfo(self._project.file[self._project.last_loaded].contents)
+        return self._project.file[self._project.last_loaded].contents
+
+    def _open_bytes(self, data, name, exclusive=None):
+        """Parses data into a new layer; exclusive defaults to whether data uses static parser state"""
+        if exclusive is None:
+            exclusive = _uses_static_state(data)
+        with _anonymous_file(name) as (f, path):
+            f.write(data)
+            f.flush()
+            return self._open_file(path, exclusive)
+
+    def _open_image(self, image):
+        # libgerbv only grows the layer array of a project while opening a file,
+        # so open a placeholder layer and hand its slot over to the image
+        file_info = self._open_bytes(_PLACEHOLDER_LAYER, 'placeholder', exclusive=False)
+        _libgerbv.gerbv_destroy_image(file_info.image)
+        file_info.image = image
+        return file_info
+
+    def _open_cached_layer(self, layer, key):
+        """Adds a CachedLayer from the layer cache, named and with the statistics of the file it was parsed from"""
+        file_info = self._open_image(layer.image)
+        # The project frees both names with g_free when it unloads the layer
+        for name, value in (('name', layer.name), ('fullPathname', layer.full_pathname)):
+            if value is not None:
+                _libgerbv.g_free(c_void_p.from_buffer(file_info, getattr(GerbvFileInfo, name).offset))
+                setattr(file_info, name, _libgerbv.g_strdup(value))
+        file_info = self._add_file_info(file_info, key)
+        file_info.image._cached_stats = layer.stats
+        return file_info
+
+    def _cache_layer(self, key, file_info):
+        self.layer_cache.put(key, file_info.image, file_info.name, file_info.fullPathname)
+
+    def _open_cached(self, data, parse):
+        key = self.layer_cache.key(data)
+        layer = self.layer_cache.get_layer(key)
+        if layer is not None:
+            return self._open_cached_layer(layer, key)
+        file_info = parse()
+        self._cache_layer(key, file_info)
+        return self._add_file_info(file_info, key)
+
+    def _add_file_info(self, file_info, source_digest=None):
+        """Wraps and adds a parsed layer; source_digest is the SHA-256 hex digest of its file, if known"""
+        file_info = FileInfo(file_info, self)
+        file_info.image._source_digest = source_digest
         self.file.append(file_info)
+        self._invalidate_bounding_box()
         return file_info
 
     def export_pdf_file(self, filename, size):
@@ -258,6 +995,136 @@ class Project:
             render_info = self._generate_render_info(size)
             _libgerbv.gerbv_export_png_file_from_project(self._project, render_info, filename.encode('utf-8'))
 
+    def render_to_array(self, size, dpi=72, out=None):
+        """Renders the visible layers into an RGBA array of shape (height, width, 4), as export_png_file would
+
+        out, if given, must be a C-contiguous uint8 array of that shape and is rendered into in place.
+        """
+        if self.files_loaded() == 0:
+            raise GerberNotFoundError
+        else:
+            render_info = self._generate_render_info(size, dpi)
+            return render_to_array(
+                lambda cr: _libgerbv.gerbv_render_all_layers_to_cairo_target(self._project, cr, render_info),
+                render_info.displayWidth,
+                render_info.displayHeight,
+                out
+            )
+
+    def render_preview(self, size=256, layer=None, min_feature_px=1.0, cache=None):
+        """Renders a low resolution RGBA preview of the project whose longer side is at most size pixels
+
+        With layer, a FileInfo of this project, only that layer is rendered on a transparent background, still over
+        the bounding box of the whole project so that the previews of all layers line up; otherwise the visible
+        layers are rendered over the background as render_to_array does.
+        Nets whose bounding box is smaller than min_feature_px pixels are skipped; regions are always drawn.
+        With cache, a ThumbnailCache, previews are looked up by the content, transform, color and alpha of the
+        rendered layers before rendering and stored after. The content is keyed by the digest of the file a layer
+        was read from where that is known, so hits do not walk the nets; small nets are only culled on a miss.
+        Skipping nets briefly marks them deleted in the native images, so do not use the layers from other threads
+        while a preview renders.
+        """
+        if self.files_loaded() == 0:
+            raise GerberNotFoundError
+        margin = 0.1
+        dpi = size / (max(self.width, self.height) + margin * 2)
+        render_info = self._generate_auto_sized_render_info(dpi)
+        layers = [layer] if layer is not None else [file_info for file_info in self.file if file_info.is_visible]
+
+        if cache is not None:
+            key = cache.key(
+                'preview',
+                size,
+                min_feature_px,
+                (render_info.lowerLeftX, render_info.lowerLeftY, render_info.displayWidth, render_info.displayHeight),
+                None if layer is not None else self.background,
+                tuple((file_info.image._content_key(), _transform_state(file_info._file_info.transform), file_info.color, file_info.alpha)
+                      for file_info in layers),
+            )
+            array = cache.get(key)
+            if array is not None:
+                return array
+
+        with ExitStack() as stack:
+            if min_feature_px > 0:
+                for file_info in layers:
+                    transform = file_info._file_info.transform
+                    scale = max(abs(transform.scaleX), abs(transform.scaleY))
+                    if scale > 0:
+                        stack.enter_context(file_info.image._hidden_small_nets(min_feature_px / (dpi * scale)))
+            if layer is not None:
+                draw = lambda cr: _libgerbv.gerbv_render_layer_to_cairo_target(cr, byref(layer._file_info), byref(render_info))
+            else:
+                draw = lambda cr: _libgerbv.gerbv_render_all_layers_to_cairo_target(self._project, cr, render_info)
+            array = render_to_array(draw, render_info.displayWidth, render_info.displayHeight)
+
+        if cache is not None:
+            cache.put(key, array)
+        return array
+
+    def auto_sized_render_shape(self, dpi=72):
+        """Returns the (height, width, 4) shape of the auto-sized RGBA image rendered by render_tiles"""
+        render_info = self._generate_auto_sized_render_info(dpi)
+        return render_info.displayHeight, render_info.displayWidth, 4
+
+    def render_tiles(self, dpi=72, tile_size=4096, workers=1):
+        """Renders the visible layers over the auto-sized bounding box, one tile at a time
+
+        Yields (x, y, array) in row-major order, where x and y are the pixel offsets of the tile in the full image
+        and array is an RGBA array of at most tile_size x tile_size pixels.
+        With workers > 1 tiles are rendered by that many threads; at most workers tiles are rendered ahead,
+        so memory stays bounded by the tile size either way.
+        """
+        if self.files_loaded() == 0:
+            raise GerberNotFoundError
+        render_info = self._generate_auto_sized_render_info(dpi)
+        width = render_info.displayWidth
+        height = render_info.displayHeight
+        tiles = [(x, y) for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+        def render_tile(tile):
+            x, y = tile
+            tile_width = min(tile_size, width - x)
+            tile_height = min(tile_size, height - y)
+            # Pixel rows go down while gerbv's y axis goes up, so a tile's lower left corner is its last row
+            tile_info = GerbvRenderInfo(
+                dpi,
+                dpi,
+                render_info.lowerLeftX + x / dpi,
+                render_info.lowerLeftY + (height - y - tile_height) / dpi,
+                render_info.renderType,
+                tile_width,
+                tile_height
+            )
+            array = render_to_array(
+                lambda cr: _libgerbv.gerbv_render_all_layers_to_cairo_target(self._project, cr, tile_info),
+                tile_width,
+                tile_height
+            )
+            return x, y, array
+
+        if workers <= 1:
+            for tile in tiles:
+                yield render_tile(tile)
+            return
+        # Rendering only reads the project, and ctypes releases the GIL during the native call
+        with ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+            for tile in tiles:
+                pending.append(executor.submit(render_tile, tile))
+                if len(pending) >= workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def render_tiled_to_array(self, out, dpi=72, tile_size=4096, workers=1):
+        """Renders tile by tile into out, e.g. a numpy.memmap of shape auto_sized_render_shape(dpi)"""
+        if out.shape != self.auto_sized_render_shape(dpi):
+            raise ValueError('out must have shape {}'.format(self.auto_sized_render_shape(dpi)))
+        for x, y, tile in self.render_tiles(dpi, tile_size, workers):
+            out[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+        return out
+
     def export_auto_sized_svg_file(self, filename):
         if self.files_loaded() == 0:
             raise GerberNotFoundError
@@ -266,19 +1133,46 @@ class Project:
             _libgerbv.gerbv_export_svg_file_from_project(self._project, render_info, filename.encode('utf-8'))
 
     def translate(self, x, y):
+        bounding_box_valid = self._bounding_box_valid
         for layer in self.file:
             layer.translate(x, y)
+        # Translating every layer translates the bounding box as well, so there is no need to recompute it
+        if bounding_box_valid:
+            self._bounding_box.left += x
+            self._bounding_box.right += x
+            self._bounding_box.bottom += y
+            self._bounding_box.top += y
+            self._bounding_box_valid = True
 
     def scale(self, x, y):
         for layer in self.file:
             layer.scale(x, y)
 
+    def transform(self, matrix, bake=False):
+        """Applies a 2x3 or 3x3 affine matrix to all layers at once; see transform_projects"""
+        transform_projects([self], matrix, bake)
+
     def rotate(self, theta):
         width = self.width
         for layer in self.file:
             layer.rotate(theta)
             layer.translate(0, width)
 
+    def close(self):
+        """Destroys the native project together with all of its layers"""
+        for layer in self.file:
+            layer.image.close()
+            layer._file_info = None
+        self.file = []
+        self._finalizer()
+        self._project = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def set_margin(self, margin):
         self.margin = margin
         if self.margin < 0.001:
@@ -0,0 +1,97 @@
+from ctypes import *
+from ctypes.util import find_library
+import os
+import platform
+import threading
+
+from .exceptions import *
+
+
+def _candidates(name):
+    """Returns the usual filenames of a library, which dlopen can try without running any subprocess"""
+    system = platform.system()
+    if system == 'Darwin':
+        filenames = ['lib{}.dylib'.format(name)]
+        prefixes = ['', '/usr/local/lib/', '/opt/homebrew/lib/']
+    elif system == 'Windows':
+        filenames = ['lib{}-1.dll'.format(name), 'lib{}-2.dll'.format(name), 'lib{}.dll'.format(name)]
+        prefixes = ['']
+    else:
+        filenames = ['lib{}.so.1'.format(name), 'lib{}.so.2'.format(name), 'lib{}.so'.format(name)]
+        # libgerbv built from source installs into /usr/local/lib, which is not always on the loader path
+        prefixes = ['', '/usr/local/lib/']
+    return [prefix + filename for filename in filenames for prefix in prefixes]
+
+
+class Library:
+    """Shared library loaded on first use
+
+    Nothing is searched or loaded at import time. On first access to a function the library is loaded from
+    the path in environment_variable if set, else from the usual filenames and finally with ctypes.util.find_library;
+    the path it was loaded from is kept in path. Prototypes declared with prototype() are applied as
+    each function is first resolved; resolved functions are then plain attributes, so later calls cost nothing extra.
+    """
+
+    def __init__(self, name, environment_variable):
+        self.name = name
+        self.environment_variable = environment_variable
+        self.path = None
+        self._cdll = None
+        self._lock = threading.RLock()
+        self._prototypes = {}
+        self._functions = {}
+        self._hook = None
+
+    def prototype(self, function, argtypes=None, restype=c_int):
+        self._prototypes[function] = (argtypes, restype)
+
+    def load(self):
+        """Loads the library if it is not loaded yet and returns the CDLL; raises LibraryNotFoundError"""
+        with self._lock:
+            if self._cdll is None:
+                self._cdll, self.path = self._open()
+            return self._cdll
+
+    def _open(self):
+        path = os.environ.get(self.environment_variable)
+        if path:
+            try:
+                return CDLL(path), path
+            except OSError as e:
+                raise LibraryNotFoundError('{} is set but {} cannot be loaded: {}'.format(self.environment_variable, path, e))
+
+        for path in _candidates(self.name):
+            try:
+                return CDLL(path), path
+            except OSError:
+                continue
+
+        path = find_library(self.name)
+        if path:
+            for candidate in (path, '/usr/local/lib/' + path):
+                try:
+                    return CDLL(candidate), candidate
+                except OSError:
+                    continue
+        raise LibraryNotFoundError('lib{} was not found; install it or set {} to its path'.format(self.name, self.environment_variable))
+
+    def set_hook(self, hook):
+        """Replaces every function f by hook(name, f), now and as functions get resolved; None removes the hook"""
+        with self._lock:
+            self._hook = hook
+            for name, function in self._functions.items():
+                setattr(self, name, function if hook is None else hook(name, function))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        with self._lock:
+            function = self._functions.get(name)
+            if function is None:
+                function = getattr(self.load(), name)
+                if name in self._prototypes:
+                    function.argtypes, function.restype = self._prototypes[name]
+                self._functions[name] = function
+            wrapped = function if self._hook is None else self._hook(name, function)
+            setattr(self, name, wrapped)
+            return wrapped
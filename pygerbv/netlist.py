@@ -0,0 +1,276 @@
+from ctypes import *
+import struct
+
+import numpy as np
+
+from .enumeration import *
+from .structure import *
+
+
+_NET_SIZE = sizeof(GerbvNet)
+_CIRSEG_SIZE = sizeof(GerbvCirseg)
+_NEXT_OFFSET = GerbvNet.next.offset
+_POINTER = struct.Struct('P')
+
+# Byte layout of gerbv_net_t and gerbv_cirseg_t as NumPy dtypes, so a raw copy of the nodes can be viewed as columns
+_NET_DTYPE = np.dtype({
+    'names': ['start_x', 'start_y', 'stop_x', 'stop_y', 'left', 'right', 'bottom', 'top',
+              'aperture', 'aperture_state', 'interpolation', 'cirseg', 'layer'],
+    'formats': [np.float64] * 8 + [np.intc] * 3 + [np.uintp] * 2,
+    'offsets': [GerbvNet.start_x.offset,
+                GerbvNet.start_y.offset,
+                GerbvNet.stop_x.offset,
+                GerbvNet.stop_y.offset,
+                GerbvNet.boundingBox.offset + GerbvRenderSize.left.offset,
+                GerbvNet.boundingBox.offset + GerbvRenderSize.right.offset,
+                GerbvNet.boundingBox.offset + GerbvRenderSize.bottom.offset,
+                GerbvNet.boundingBox.offset + GerbvRenderSize.top.offset,
+                GerbvNet.aperture.offset,
+                GerbvNet.aperture_state.offset,
+                GerbvNet.interpolation.offset,
+                GerbvNet.cirseg.offset,
+                GerbvNet.layer.offset],
+    'itemsize': _NET_SIZE,
+})
+
+_CIRSEG_DTYPE = np.dtype({
+    'names': [name for name, _ in GerbvCirseg._fields_],
+    'formats': [np.float64] * len(GerbvCirseg._fields_),
+    'offsets': [getattr(GerbvCirseg, name).offset for name, _ in GerbvCirseg._fields_],
+    'itemsize': _CIRSEG_SIZE,
+})
+
+NET_COLUMNS = ('start_x', 'start_y', 'stop_x', 'stop_y', 'left', 'right', 'bottom', 'top',
+               'aperture', 'aperture_state', 'interpolation', 'layer')
+CIRSEG_COLUMNS = ('cp_x', 'cp_y', 'cirseg_width', 'cirseg_height', 'angle1', 'angle2')
+
+
+def first_net_address(netlist):
+    """Returns the address of the first net after the head node of the netlist, or None"""
+    head = cast(netlist, c_void_p).value
+    if not head:
+        return None
+    return c_void_p.from_address(head + _NEXT_OFFSET).value
+
+
+def _read_from(address, count=None):
+    """Copies up to count nets, all if None, starting with the one at address
+
+    Each node costs a single memory copy; the next pointer is then read from the copied bytes.
+    The walk itself runs in Python, one iteration per net (about 2 us each), as a linked list cannot be copied in bulk.
+    Returns the records, the addresses of the nets and the address of the net after the last one copied.
+    """
+    buffer = bytearray()
+    addresses = []
+    while address and (count is None or len(addresses) < count):
+        addresses.append(address)
+        buffer += string_at(address, _NET_SIZE)
+        address = _POINTER.unpack_from(buffer, len(buffer) - _NET_SIZE + _NEXT_OFFSET)[0]
+    return np.frombuffer(buffer, dtype=_NET_DTYPE), np.array(addresses, dtype=np.uintp), address
+
+
+def read_nets(netlist):
+    """Copies every net of the netlist into a structured array; returns the records and the addresses of the nets"""
+    records, addresses, _ = _read_from(first_net_address(netlist))
+    return records, addresses
+
+
+def iter_read_nets(netlist, batch_size):
+    """Walks the netlist lazily, yielding (records, addresses) of batch_size nets at a time like read_nets"""
+    address = first_net_address(netlist)
+    while address:
+        records, addresses, address = _read_from(address, batch_size)
+        yield records, addresses
+
+
+def read_cirsegs(addresses):
+    """Copies the gerbv_cirseg_t structures at the given addresses into a structured array"""
+    buffer = b''.join(string_at(address, _CIRSEG_SIZE) for address in addresses.tolist())
+    return np.frombuffer(buffer, dtype=_CIRSEG_DTYPE)
+
+
+def netlist_arrays(netlist):
+    """Returns the netlist as a dict of read-only column arrays
+
+    Cirseg columns are NaN for nets without a cirseg (i.e. anything other than arcs).
+    """
+    records, addresses = read_nets(netlist)
+    columns = {name: np.ascontiguousarray(records[name]) for name in NET_COLUMNS}
+    columns['address'] = addresses
+    columns.update(cirseg_columns(records))
+
+    for values in columns.values():
+        values.flags.writeable = False
+    return columns
+
+
+def cirseg_columns(records):
+    """Returns the CIRSEG_COLUMNS of the records, NaN for nets without a cirseg"""
+    cirseg_addresses = records['cirseg']
+    has_cirseg = cirseg_addresses != 0
+    cirsegs = read_cirsegs(cirseg_addresses[has_cirseg])
+    columns = {}
+    for column, (name, _) in zip(CIRSEG_COLUMNS, GerbvCirseg._fields_):
+        values = np.full(len(records), np.nan)
+        values[has_cirseg] = cirsegs[name]
+        columns[column] = values
+    return columns
+
+
+def region_mask(interpolation):
+    """Returns which nets belong to a region (G36/G37), including the PAREA_START and PAREA_END markers"""
+    starts = interpolation == Interpolation.PAREA_START
+    ends = interpolation == Interpolation.PAREA_END
+    return (np.cumsum(starts) - np.cumsum(ends) + ends) > 0
+
+
+def small_nets(columns, min_size):
+    """Returns which drawn nets have a bounding box smaller than min_size in both directions
+
+    Region nets are never included, since dropping part of an outline would change the whole region,
+    and neither are nets whose bounding box was never filled in by libgerbv.
+    """
+    left, right, bottom, top = (np.where(np.isfinite(columns[name]), columns[name], np.nan) for name in ('left', 'right', 'bottom', 'top'))
+    valid = ~np.isnan(left + right + bottom + top)
+    width = np.where(valid, right - left, -1)
+    height = np.where(valid, top - bottom, -1)
+    valid &= (width >= 0) & (height >= 0)
+    drawn = (columns['aperture_state'] != ApertureState.OFF) & (columns['interpolation'] != Interpolation.DELETED)
+    return valid & drawn & (np.maximum(width, height) < min_size) & ~region_mask(columns['interpolation'])
+
+
+def net_extents(columns):
+    """Returns (left, bottom, right, top) of every net
+
+    Nets whose bounding box was never filled in by libgerbv fall back to the extent of their start and stop points.
+    """
+    left = columns['left'].copy()
+    right = columns['right'].copy()
+    bottom = columns['bottom'].copy()
+    top = columns['top'].copy()
+    invalid = ~(np.isfinite(left) & np.isfinite(right) & np.isfinite(bottom) & np.isfinite(top))
+    invalid |= (left > right) | (bottom > top)
+    left[invalid] = np.minimum(columns['start_x'], columns['stop_x'])[invalid]
+    right[invalid] = np.maximum(columns['start_x'], columns['stop_x'])[invalid]
+    bottom[invalid] = np.minimum(columns['start_y'], columns['stop_y'])[invalid]
+    top[invalid] = np.maximum(columns['start_y'], columns['stop_y'])[invalid]
+    return left, bottom, right, top
+
+
+def write_nets(records, addresses):
+    """Copies records read by read_nets back over the nets at the given addresses"""
+    base = records.ctypes.data
+    for i, address in enumerate(addresses.tolist()):
+        memmove(address, base + i * _NET_SIZE, _NET_SIZE)
+
+
+def remap_apertures(netlist, remap):
+    """Replaces the aperture of every net by remap[aperture], remap being an array of APERTURE_MAX D codes
+
+    Only the nets whose aperture changes are written back.
+    """
+    records, addresses = read_nets(netlist)
+    apertures = records['aperture']
+    valid = np.flatnonzero((apertures >= 0) & (apertures < APERTURE_MAX))
+    changed = valid[remap[apertures[valid]] != apertures[valid]]
+    records = records[changed]
+    records['aperture'] = remap[records['aperture']]
+    write_nets(records, addresses[changed])
+
+
+def transform_box(matrix, left, bottom, right, top):
+    xs = np.stack([left, right, left, right])
+    ys = np.stack([bottom, bottom, top, top])
+    x = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+    y = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+    return x.min(axis=0), y.min(axis=0), x.max(axis=0), y.max(axis=0)
+
+
+def transform_netlist(netlist, matrix):
+    """Applies a 2D similarity transform, given as a 3x3 affine matrix, to the coordinates of every net in place
+
+    Start and stop points, arc centers, radii and angles are transformed; a reflection also reverses the direction
+    of arcs. Bounding boxes become the boxes around the transformed ones. Apertures are left untouched.
+    """
+    records, addresses = read_nets(netlist)
+    for x, y in (('start_x', 'start_y'), ('stop_x', 'stop_y')):
+        xs = records[x].copy()
+        ys = records[y].copy()
+        records[x] = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+        records[y] = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+
+    valid = np.isfinite(records['left']) & np.isfinite(records['right']) & np.isfinite(records['bottom']) & np.isfinite(records['top'])
+    valid &= (records['left'] <= records['right']) & (records['bottom'] <= records['top'])
+    left, bottom, right, top = transform_box(matrix, records['left'][valid], records['bottom'][valid], records['right'][valid], records['top'][valid])
+    records['left'][valid] = left
+    records['bottom'][valid] = bottom
+    records['right'][valid] = right
+    records['top'][valid] = top
+
+    determinant = matrix[0, 0] * matrix[1, 1] - matrix[0, 1] * matrix[1, 0]
+    reflected = determinant < 0
+    rotation = np.degrees(np.arctan2(matrix[1, 0], matrix[0, 0]))
+    scale = np.sqrt(abs(determinant))
+    cirseg_addresses = records['cirseg'][records['cirseg'] != 0]
+    cirsegs = read_cirsegs(cirseg_addresses).copy()
+    cp_x = cirsegs['cp_x'].copy()
+    cp_y = cirsegs['cp_y'].copy()
+    cirsegs['cp_x'] = matrix[0, 0] * cp_x + matrix[0, 1] * cp_y + matrix[0, 2]
+    cirsegs['cp_y'] = matrix[1, 0] * cp_x + matrix[1, 1] * cp_y + matrix[1, 2]
+    cirsegs['width'] *= scale
+    cirsegs['height'] *= scale
+    if reflected:
+        cirsegs['angle1'] = rotation - cirsegs['angle1']
+        cirsegs['angle2'] = rotation - cirsegs['angle2']
+        interpolation = records['interpolation'].copy()
+        records['interpolation'][interpolation == Interpolation.CW_CIRCULAR] = Interpolation.CCW_CIRCULAR
+        records['interpolation'][interpolation == Interpolation.CCW_CIRCULAR] = Interpolation.CW_CIRCULAR
+    else:
+        cirsegs['angle1'] += rotation
+        cirsegs['angle2'] += rotation
+
+    write_nets(records, addresses)
+    base = cirsegs.ctypes.data
+    for i, address in enumerate(cirseg_addresses.tolist()):
+        memmove(address, base + i * _CIRSEG_SIZE, _CIRSEG_SIZE)
+
+
+class Net:
+    """One net read by Image.iter_nets; the fields are those of netlist_arrays"""
+    __slots__ = NET_COLUMNS + CIRSEG_COLUMNS + ('address',)
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return 'Net({})'.format(', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class NetFilter:
+    """Selects nets by aperture D code, aperture state, interpolation and bounding box
+
+    Every criterion left as None accepts all nets. box is (x1, y1, x2, y2) and keeps the nets whose bounding box
+    intersects it. Nets are tested one by one, so a region cut by box or interpolations comes out partially.
+    """
+    LINES = (Interpolation.LINEARx1, Interpolation.LINEARx10, Interpolation.LINEARx01, Interpolation.LINEARx001)
+    ARCS = (Interpolation.CW_CIRCULAR, Interpolation.CCW_CIRCULAR)
+    REGION_BOUNDS = (Interpolation.PAREA_START, Interpolation.PAREA_END)
+
+    def __init__(self, apertures=None, aperture_states=None, interpolations=None, box=None):
+        self.apertures = None if apertures is None else np.array(sorted(apertures), dtype=np.intc)
+        self.aperture_states = None if aperture_states is None else np.array(sorted(aperture_states), dtype=np.intc)
+        self.interpolations = None if interpolations is None else np.array(sorted(interpolations), dtype=np.intc)
+        self.box = box
+
+    def mask(self, records):
+        """Returns which of the records, or netlist_arrays columns, pass the filter"""
+        keep = np.ones(len(records['aperture']), dtype=bool)
+        for column, values in (('aperture', self.apertures), ('aperture_state', self.aperture_states), ('interpolation', self.interpolations)):
+            if values is not None:
+                keep &= np.isin(records[column], values)
+        if self.box is not None and keep.any():
+            x1, y1, x2, y2 = self.box
+            left, bottom, right, top = net_extents(records)
+            keep &= (left <= max(x1, x2)) & (right >= min(x1, x2)) & (bottom <= max(y1, y2)) & (top >= min(y1, y2))
+        return keep
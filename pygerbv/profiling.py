@@ -0,0 +1,149 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+import os
+import threading
+import time
+
+from .gerbv import _libgerbv
+
+
+__all__ = ['CallStats', 'Profiler', 'profiler', 'profiling']
+
+
+@dataclass
+class CallStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError, ValueError):
+        return 0
+
+
+class _ProfiledFunction:
+    """Stands in for a libgerbv function and reports every call to the profiler"""
+
+    def __init__(self, profiler, name, function):
+        self._profiler = profiler
+        self._name = name
+        self._function = function
+
+    def __getattr__(self, name):
+        return getattr(self._function, name)
+
+    def __call__(self, *args):
+        # Layers are opened from, and exports written to, the file named by the first bytes argument
+        path = next((arg for arg in args if isinstance(arg, bytes)), None)
+        bytes_read = _file_size(path) if path is not None and self._name.startswith('gerbv_open') else 0
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        try:
+            return self._function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            bytes_written = _file_size(path) if path is not None and self._name.startswith('gerbv_export') else 0
+            self._profiler._record(self._name, start_ns, elapsed, bytes_read, bytes_written)
+
+
+class Profiler:
+    """Records the count, cumulative and maximum latency, and file bytes read or written of every libgerbv call
+
+    While enabled, every function of the library, including those resolved later, is replaced by a recording
+    wrapper; disabling puts the original functions back, so a disabled profiler costs nothing.
+    Latencies include the ctypes argument conversion.
+    With spans, every call is also kept as an OpenTelemetry-style span, up to max_spans of the most recent ones.
+    """
+
+    def __init__(self, library, max_spans=100000):
+        self._library = library
+        self._lock = threading.Lock()
+        self._enabled = False
+        self._stats = {}
+        self._spans = deque(maxlen=max_spans)
+        self.record_spans = False
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def enable(self, spans=False):
+        self.record_spans = spans
+        if not self._enabled:
+            self._library.set_hook(lambda name, function: _ProfiledFunction(self, name, function))
+            self._enabled = True
+
+    def disable(self):
+        if self._enabled:
+            self._library.set_hook(None)
+            self._enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._spans.clear()
+
+    def _record(self, name, start_ns, elapsed, bytes_read, bytes_written):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = CallStats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.bytes_read += bytes_read
+            stats.bytes_written += bytes_written
+            if self.record_spans:
+                self._spans.append((name, start_ns, elapsed, bytes_read, bytes_written, threading.get_ident()))
+
+    def stats(self):
+        """Returns {function name: CallStats} of the calls recorded so far"""
+        with self._lock:
+            return {name: CallStats(**asdict(stats)) for name, stats in self._stats.items()}
+
+    def as_dict(self):
+        """Returns the recorded statistics as plain dicts, e.g. for JSON"""
+        return {name: asdict(stats) for name, stats in self.stats().items()}
+
+    def spans(self):
+        """Returns the recorded calls as dicts shaped like OpenTelemetry spans"""
+        with self._lock:
+            spans = list(self._spans)
+        return [{
+            'name': name,
+            'start_time_unix_nano': start_ns,
+            'end_time_unix_nano': start_ns + int(elapsed * 1e9),
+            'attributes': {
+                'code.namespace': 'libgerbv',
+                'thread.id': thread_id,
+                'pygerbv.bytes_read': bytes_read,
+                'pygerbv.bytes_written': bytes_written,
+            },
+        } for name, start_ns, elapsed, bytes_read, bytes_written, thread_id in spans]
+
+
+profiler = Profiler(_libgerbv)
+
+
+@contextmanager
+def profiling(spans=False, reset=True):
+    """Profiles the libgerbv calls made in the with block and yields the profiler"""
+    was_enabled = profiler.enabled
+    if reset:
+        profiler.reset()
+    profiler.enable(spans)
+    try:
+        yield profiler
+    finally:
+        if not was_enabled:
+            profiler.disable()
+
+
+if os.environ.get('PYGERBV_PROFILE'):
+    profiler.enable(spans=os.environ['PYGERBV_PROFILE'] == 'spans')
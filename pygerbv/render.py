@@ -0,0 +1,51 @@
+from ctypes import *
+import sys
+
+import numpy as np
+
+from .exceptions import *
+from .library import Library
+
+
+CAIRO_FORMAT_ARGB32 = 0
+CAIRO_STATUS_SUCCESS = 0
+
+_libcairo = Library('cairo', 'PYGERBV_CAIRO_LIBRARY')
+_libcairo.prototype('cairo_image_surface_create_for_data', [c_void_p, c_int, c_int, c_int, c_int], restype=c_void_p)
+_libcairo.prototype('cairo_surface_status', [c_void_p], restype=c_int)
+_libcairo.prototype('cairo_surface_flush', [c_void_p])
+_libcairo.prototype('cairo_surface_destroy', [c_void_p])
+_libcairo.prototype('cairo_create', [c_void_p], restype=c_void_p)
+_libcairo.prototype('cairo_destroy', [c_void_p])
+
+
+def render_to_array(draw, width, height, out=None):
+    """Calls draw(cr) with a cairo context whose target is an RGBA array, and returns the array
+
+    out, if given, must be a C-contiguous uint8 array of shape (height, width, 4). Otherwise a new zeroed one is allocated.
+    Pixels are premultiplied by alpha, as cairo stores them.
+    """
+    if out is None:
+        out = np.zeros((height, width, 4), dtype=np.uint8)
+    elif out.shape != (height, width, 4) or out.dtype != np.uint8 or not out.flags.c_contiguous or not out.flags.writeable:
+        raise ValueError('out must be a writable C-contiguous uint8 array of shape {}'.format((height, width, 4)))
+
+    surface = _libcairo.cairo_image_surface_create_for_data(out.ctypes.data, CAIRO_FORMAT_ARGB32, width, height, width * 4)
+    try:
+        if _libcairo.cairo_surface_status(surface) != CAIRO_STATUS_SUCCESS:
+            raise RenderError
+        cr = _libcairo.cairo_create(surface)
+        try:
+            draw(cr)
+        finally:
+            _libcairo.cairo_destroy(cr)
+        _libcairo.cairo_surface_flush(surface)
+    finally:
+        _libcairo.cairo_surface_destroy(surface)
+
+    # Cairo stores each pixel as a native-endian 32-bit ARGB word, i.e. BGRA bytes on little-endian machines
+    if sys.byteorder == 'little':
+        out[..., [0, 2]] = out[..., [2, 0]]
+    else:
+        out[...] = np.roll(out, -1, axis=2)
+    return out
@@ -0,0 +1,126 @@
+import math
+
+import numpy as np
+
+from .enumeration import *
+from .netlist import net_extents, region_mask
+
+
+class GridIndex:
+    """Uniform grid over axis-aligned boxes, answering rectangle and nearest-box queries
+
+    Every box is registered in each cell it overlaps. Boxes overlapping more than max_cells_per_item cells,
+    such as large pours, are kept aside and tested directly on every query instead.
+    Queries return the positions of the boxes in the arrays the index was built from.
+    """
+
+    def __init__(self, left, bottom, right, top, ids=None, cell_size=None, max_cells_per_item=64):
+        self.left = np.asarray(left, dtype=np.float64)
+        self.bottom = np.asarray(bottom, dtype=np.float64)
+        self.right = np.asarray(right, dtype=np.float64)
+        self.top = np.asarray(top, dtype=np.float64)
+        self.ids = np.arange(len(self.left)) if ids is None else np.asarray(ids)
+        count = len(self.left)
+        if count == 0:
+            self.origin = (0.0, 0.0)
+            self.extent = (0.0, 0.0)
+            self.cell_size = 1.0
+            self.shape = (1, 1)
+            self.cells = np.zeros(2, dtype=np.intp)
+            self.items = np.zeros(0, dtype=np.intp)
+            self.large = np.zeros(0, dtype=np.intp)
+            return
+
+        x0, y0 = self.left.min(), self.bottom.min()
+        x1, y1 = self.right.max(), self.top.max()
+        if cell_size is None:
+            # About one cell per box, but never smaller than a typical box
+            typical = np.median(np.maximum(self.right - self.left, self.top - self.bottom))
+            cell_size = max(math.sqrt(max((x1 - x0) * (y1 - y0), 0) / count), typical)
+        if not cell_size > 0:
+            cell_size = max(x1 - x0, y1 - y0, 1e-9)
+        nx = int((x1 - x0) / cell_size) + 1
+        ny = int((y1 - y0) / cell_size) + 1
+        self.origin = (x0, y0)
+        self.extent = (x1, y1)
+        self.cell_size = cell_size
+        self.shape = (ny, nx)
+
+        ix0, iy0 = self._cell(self.left, self.bottom)
+        ix1, iy1 = self._cell(self.right, self.top)
+        widths = ix1 - ix0 + 1
+        spans = widths * (iy1 - iy0 + 1)
+        large = spans > max_cells_per_item
+        self.large = np.flatnonzero(large)
+        small = np.flatnonzero(~large)
+
+        # Expand every small box into one (cell, box) pair per overlapped cell, then group the pairs by cell
+        counts = spans[small]
+        firsts = np.cumsum(counts) - counts
+        items = np.repeat(small, counts)
+        offsets = np.arange(int(counts.sum())) - np.repeat(firsts, counts)
+        widths = np.repeat(widths[small], counts)
+        cells = (np.repeat(iy0[small], counts) + offsets // widths) * nx + np.repeat(ix0[small], counts) + offsets % widths
+        order = np.argsort(cells, kind='stable')
+        self.items = items[order]
+        self.cells = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=nx * ny))])
+
+    @classmethod
+    def from_netlist(cls, columns, **kwargs):
+        """Builds an index over the nets that draw something, i.e. skipping moves and deleted nets"""
+        left, bottom, right, top = net_extents(columns)
+        drawn = (columns['aperture_state'] != ApertureState.OFF) | region_mask(columns['interpolation'])
+        drawn &= columns['interpolation'] != Interpolation.DELETED
+        ids = np.flatnonzero(drawn)
+        return cls(left[ids], bottom[ids], right[ids], top[ids], ids=ids, **kwargs)
+
+    def _cell(self, x, y):
+        ny, nx = self.shape
+        ix = np.clip(np.floor((x - self.origin[0]) / self.cell_size), 0, nx - 1).astype(np.intp)
+        iy = np.clip(np.floor((y - self.origin[1]) / self.cell_size), 0, ny - 1).astype(np.intp)
+        return ix, iy
+
+    def _candidates(self, x1, y1, x2, y2):
+        candidates = [self.large]
+        if x2 >= self.origin[0] and x1 <= self.extent[0] and y2 >= self.origin[1] and y1 <= self.extent[1]:
+            nx = self.shape[1]
+            ix1, iy1 = self._cell(x1, y1)
+            ix2, iy2 = self._cell(x2, y2)
+            # Cells are stored row by row, so the cells of each row of the query form one contiguous slice
+            for iy in range(int(iy1), int(iy2) + 1):
+                candidates.append(self.items[self.cells[iy * nx + ix1]:self.cells[iy * nx + ix2 + 1]])
+        return np.unique(np.concatenate(candidates))
+
+    def query(self, x1, y1, x2, y2):
+        """Returns the ids of the boxes intersecting the rectangle, in ascending order"""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        candidates = self._candidates(x1, y1, x2, y2)
+        hits = ((self.left[candidates] <= x2) & (self.right[candidates] >= x1)
+                & (self.bottom[candidates] <= y2) & (self.top[candidates] >= y1))
+        return self.ids[candidates[hits]]
+
+    def distances(self, x, y, positions=None):
+        """Returns the distance from the point to each box, 0 when the point is inside"""
+        if positions is None:
+            positions = slice(None)
+        dx = np.maximum(np.maximum(self.left[positions] - x, x - self.right[positions]), 0)
+        dy = np.maximum(np.maximum(self.bottom[positions] - y, y - self.top[positions]), 0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, x, y, k=1):
+        """Returns the ids of the k boxes nearest to the point and their distances, nearest first"""
+        if len(self.left) == 0 or k <= 0:
+            return self.ids[:0], np.zeros(0)
+        radius = self.cell_size
+        while True:
+            x1, y1, x2, y2 = x - radius, y - radius, x + radius, y + radius
+            covers_all = x1 <= self.origin[0] and y1 <= self.origin[1] and x2 >= self.extent[0] and y2 >= self.extent[1]
+            candidates = self._candidates(x1, y1, x2, y2)
+            if len(candidates) >= k or covers_all:
+                distances = self.distances(x, y, candidates)
+                order = np.argsort(distances, kind='stable')[:k]
+                # Boxes outside the searched square may still be nearer than the k-th candidate beyond the radius
+                if covers_all or distances[order[-1]] <= radius:
+                    return self.ids[candidates[order]], distances[order]
+            radius *= 2
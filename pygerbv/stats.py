@@ -0,0 +1,100 @@
+from collections import namedtuple
+from ctypes import *
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .enumeration import *
+from .structure import *
+
+
+__all__ = ['ParseMessage', 'ApertureUsage', 'DrillUsage', 'GerberStats', 'DrillStats']
+
+
+ParseMessage = namedtuple('ParseMessage', ['layer', 'type', 'text'])
+
+
+@dataclass
+class ApertureUsage:
+    number: int
+    layer: int
+    count: int
+    type: ApertureType
+    parameters: Tuple[float, ...]
+
+
+@dataclass
+class DrillUsage:
+    number: int
+    size: float
+    unit: Optional[str]
+    count: int
+
+
+@dataclass
+class GerberStats:
+    layer_count: int
+    counts: Dict[str, int]
+    apertures: List[ApertureUsage]
+    d_codes: List[ApertureUsage]
+    messages: List[ParseMessage]
+
+
+@dataclass
+class DrillStats:
+    layer_count: int
+    counts: Dict[str, int]
+    drills: List[DrillUsage]
+    messages: List[ParseMessage]
+    detect: Optional[str]
+
+
+def _decode(text):
+    return text.decode('utf-8', 'replace') if text is not None else None
+
+
+def _walk(entry):
+    while entry:
+        yield entry.contents
+        entry = entry.contents.next
+
+
+def _counts(stats):
+    return {name: getattr(stats, name) for name, ctype in stats._fields_ if ctype is c_int and name != 'layer_count'}
+
+
+def parse_messages(error_list):
+    # libgerbv fills the head node of its lists in place, so an unused head has no text
+    return [ParseMessage(e.layer, MessageType(e.type), _decode(e.error_text).rstrip()) for e in _walk(error_list) if e.error_text is not None]
+
+
+def _aperture_usages(aperture_list):
+    # An unused head node has number -1
+    return [ApertureUsage(a.number, a.layer, a.count, ApertureType(a.type), tuple(a.parameter)) for a in _walk(aperture_list) if a.number >= 0]
+
+
+def gerber_stats(stats):
+    """Builds GerberStats from a gerbv_stats_t"""
+    return GerberStats(
+        stats.layer_count,
+        _counts(stats),
+        _aperture_usages(stats.aperture_list),
+        _aperture_usages(stats.D_code_list),
+        parse_messages(stats.error_list),
+    )
+
+
+def drill_stats(stats):
+    """Builds DrillStats from a gerbv_drill_stats_t"""
+    return DrillStats(
+        stats.layer_count,
+        _counts(stats),
+        [DrillUsage(d.drill_num, d.drill_size, _decode(d.drill_unit), d.drill_count) for d in _walk(stats.drill_list) if d.drill_num >= 0],
+        parse_messages(stats.error_list),
+        _decode(stats.detect),
+    )
+
+
+def is_empty(stats):
+    """Returns whether GerberStats or DrillStats hold nothing, as the statistics libgerbv allocates for every image do"""
+    usages = getattr(stats, 'apertures', None) or getattr(stats, 'd_codes', None) or getattr(stats, 'drills', None)
+    return not stats.messages and not usages and not any(stats.counts.values())
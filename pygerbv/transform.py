@@ -0,0 +1,109 @@
+import numpy as np
+
+from .apertures import transform_apertures
+
+
+__all__ = ['affine_matrix', 'transform_projects']
+
+
+def affine_matrix(translate=(0, 0), scale=(1, 1), rotation=0):
+    """Returns the 3x3 matrix that scales, then rotates by rotation radians, then translates"""
+    c, s = np.cos(rotation), np.sin(rotation)
+    return np.array([
+        [scale[0] * c, -scale[1] * s, translate[0]],
+        [scale[0] * s, scale[1] * c, translate[1]],
+        [0, 0, 1],
+    ])
+
+
+def _as_matrices(matrices, count):
+    matrices = np.asarray(matrices, dtype=np.float64)
+    if matrices.shape[-2:] not in ((2, 3), (3, 3)):
+        raise ValueError('Affine matrices must be 2x3 or 3x3')
+    matrices = matrices[..., :2, :]
+    if matrices.ndim == 2:
+        matrices = np.broadcast_to(matrices, (count, 2, 3))
+    if len(matrices) != count:
+        raise ValueError('Expected {} matrices, got {}'.format(count, len(matrices)))
+    return matrices
+
+
+def _layer_matrices(transforms):
+    """Returns the (n, 2, 3) affine matrices of gerbv user transformations
+
+    gerbv maps a point p of the image to translate + diag(scaleX, scaleY) @ R(rotation) @ p,
+    where mirroring around X or Y negates scaleY or scaleX respectively.
+    """
+    tx = np.array([t.translateX for t in transforms])
+    ty = np.array([t.translateY for t in transforms])
+    dx = np.array([t.scaleX * (-1 if t.mirrorAroundY else 1) for t in transforms])
+    dy = np.array([t.scaleY * (-1 if t.mirrorAroundX else 1) for t in transforms])
+    rotation = np.array([t.rotation for t in transforms])
+    c, s = np.cos(rotation), np.sin(rotation)
+    return np.stack([
+        np.stack([dx * c, -dx * s, tx], axis=-1),
+        np.stack([dy * s, dy * c, ty], axis=-1),
+    ], axis=1)
+
+
+def _decompose(matrices):
+    """Splits (n, 2, 3) matrices into gerbv's translate, scale, rotation and mirrorAroundX
+
+    Raises ValueError for matrices with shear, which a user transformation cannot express.
+    """
+    a, b = matrices[:, 0, 0], matrices[:, 0, 1]
+    c, d = matrices[:, 1, 0], matrices[:, 1, 1]
+    dx = np.hypot(a, b)
+    if np.any(dx == 0):
+        raise ValueError('Degenerate transformation')
+    cos, sin = a / dx, -b / dx
+    dy = c * sin + d * cos
+    if not np.allclose(np.stack([dy * sin, dy * cos], axis=-1), np.stack([c, d], axis=-1), atol=1e-12, rtol=1e-9):
+        raise ValueError('Transformation has a shear component, which gerbv cannot represent')
+    return matrices[:, 0, 2], matrices[:, 1, 2], dx, np.abs(dy), np.arctan2(sin, cos), dy < 0
+
+
+def is_rigid(matrix):
+    """Returns whether the linear part of a 2x3 or 3x3 affine matrix only rotates and mirrors"""
+    linear = np.asarray(matrix, dtype=np.float64)[..., :2, :2]
+    return np.allclose(linear @ np.swapaxes(linear, -1, -2), np.eye(2), atol=1e-9)
+
+
+def _compose(outer, inner):
+    """Returns outer after inner for stacks of 2x3 affine matrices"""
+    linear = outer[:, :, :2] @ inner[:, :, :2]
+    translation = (outer[:, :, :2] @ inner[:, :, 2:])[:, :, 0] + outer[:, :, 2]
+    return np.concatenate([linear, translation[:, :, None]], axis=2)
+
+
+def transform_projects(projects, matrices, bake=False):
+    """Applies an affine transformation to every layer of every project
+
+    matrices is a single 2x3 or 3x3 affine matrix applied to all projects, or one matrix per project.
+    The transformation is applied on top of each layer's current transformation, in project coordinates.
+
+    Without bake the result is stored in the layers' user transformations, so it must be free of shear.
+    With bake the combined transformation is applied to the image geometry itself and the layer
+    transformations are reset; it must then be rigid (rotation, translation and mirroring only), and
+    every aperture must be able to follow it (see transform_apertures), or no layer is changed.
+    """
+    projects = list(projects)
+    matrices = _as_matrices(matrices, len(projects))
+    layers = [layer for project in projects for layer in project.file]
+    if not layers:
+        return
+    owners = np.repeat(np.arange(len(projects)), [len(project.file) for project in projects])
+    combined = _compose(matrices[owners], _layer_matrices([layer._file_info.transform for layer in layers]))
+
+    if bake:
+        if not is_rigid(combined):
+            raise ValueError('Only rigid transformations can be baked into the image geometry')
+        for layer, matrix in zip(layers, combined):
+            transform_apertures(layer.image._image, matrix, check=True)
+        for layer, matrix in zip(layers, combined):
+            layer._set_transform(0, 0, 1, 1, 0, False)
+            layer.image.transform(matrix)
+        return
+
+    for layer, values in zip(layers, zip(*_decompose(combined))):
+        layer._set_transform(*values)
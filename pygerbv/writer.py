@@ -0,0 +1,273 @@
+import tempfile
+
+import numpy as np
+
+from . import gerbv
+from .enumeration import *
+from .structure import APERTURE_MIN
+
+
+__all__ = ['GerberWriter', 'ExcellonWriter']
+
+
+_UNITS = {'in': 'IN', 'mm': 'MM'}
+_APERTURE_TEMPLATES = {
+    ApertureType.CIRCLE: 'C',
+    ApertureType.RECTANGLE: 'R',
+    ApertureType.OVAL: 'O',
+    ApertureType.POLYGON: 'P',
+}
+
+
+def _points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError('Points must be an array of shape (n, 2)')
+    return points
+
+
+def _runs(values, count):
+    """Returns (start, stop, value) of the runs of equal values, where values is a scalar or an array of count values"""
+    values = np.asarray(values)
+    if values.ndim == 0:
+        return [(0, count, values.item())] if count else []
+    if len(values) != count:
+        raise ValueError('Expected {} values, got {}'.format(count, len(values)))
+    bounds = np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1, [count]]).tolist()
+    return [(start, stop, values[start].item()) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+class _Writer:
+    """Writes to a path or a binary file object, in chunks of at most chunk_size primitives"""
+
+    def __init__(self, target, chunk_size):
+        if target is None:
+            self._file = tempfile.TemporaryFile()
+            self._owns_file = True
+        elif isinstance(target, str):
+            self._file = open(target, 'wb')
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+        self.target = target
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def _write(self, text):
+        if self.closed:
+            raise ValueError('Writing to a closed writer')
+        self._file.write(text.encode('ascii'))
+
+    def _write_rows(self, template, *columns):
+        """Writes template once per row of the columns, formatting chunk_size rows with a single % operation"""
+        count = len(columns[0]) if columns else 0
+        for start in range(0, count, self.chunk_size):
+            rows = np.stack([column[start:start + self.chunk_size] for column in columns], axis=1)
+            self._write((template * len(rows)) % tuple(rows.ravel().tolist()))
+
+    def _finish(self):
+        pass
+
+    def close(self, load=False):
+        """Finishes the file; with load, parses the written file and returns it as an Image"""
+        if not self.closed:
+            self._finish()
+            self.closed = True
+            if self._owns_file and self.target is not None:
+                self._file.close()
+            else:
+                self._file.flush()
+        if not load:
+            return None
+        if isinstance(self.target, str):
+            return gerbv.Image.from_filename(self.target)
+        self._file.seek(0)
+        return gerbv.Image.from_fileobj(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self.target is None:
+            self._file.close()
+
+
+class GerberWriter(_Writer):
+    """Streams RS-274X (Gerber X2) from arrays of lines, arcs, flashes and regions
+
+    target is a path, a binary file object, or None to write to a temporary file that close(load=True) parses.
+    Coordinates are in unit ('in' or 'mm') and are written with integer_digits.decimal_digits precision.
+    Apertures are defined with add_aperture() as they are needed; identical apertures share one D code.
+    Only chunk_size primitives are formatted at a time, so memory does not grow with the size of the output.
+    """
+
+    def __init__(self, target=None, unit='in', integer_digits=3, decimal_digits=6, file_function=None, part='Single',
+                 attributes=None, chunk_size=65536):
+        super().__init__(target, chunk_size)
+        self.unit = unit
+        self.decimal_digits = decimal_digits
+        self._scale = 10 ** decimal_digits
+        self._apertures = {}
+        self._aperture = None
+        self._interpolation = None
+        self._dark = True
+        header = []
+        if part:
+            header.append('%TF.Part,{}*%'.format(part))
+        if file_function:
+            header.append('%TF.FileFunction,{}*%'.format(file_function))
+        for name, value in (attributes or {}).items():
+            header.append('%TF.{},{}*%'.format(name, value))
+        header.append('%FSLAX{0}{1}Y{0}{1}*%'.format(integer_digits, decimal_digits))
+        header.append('%MO{}*%'.format(_UNITS[unit]))
+        header.append('%LPD*%')
+        # Arcs are written with multi quadrant mode only
+        header.append('G75*')
+        self._write('\n'.join(header) + '\n')
+
+    def _number(self, value):
+        return format(float(value), '.{}f'.format(self.decimal_digits)).rstrip('0').rstrip('.') or '0'
+
+    def add_aperture(self, type, *parameters):
+        """Defines a standard aperture and returns its D code; type is an ApertureType
+
+        The parameters are those of the Gerber aperture template: CIRCLE (diameter[, hole]), RECTANGLE and
+        OVAL (width, height[, hole]), POLYGON (diameter, vertices[, rotation[, hole]]).
+        """
+        type = ApertureType(type)
+        if type not in _APERTURE_TEMPLATES:
+            raise ValueError('Unsupported aperture type: {}'.format(type.name))
+        key = (type, tuple(float(parameter) for parameter in parameters))
+        number = self._apertures.get(key)
+        if number is None:
+            number = self._apertures[key] = APERTURE_MIN + len(self._apertures)
+            values = [str(int(p)) if type == ApertureType.POLYGON and i == 1 else self._number(p) for i, p in enumerate(parameters)]
+            self._write('%ADD{}{},{}*%\n'.format(number, _APERTURE_TEMPLATES[type], 'X'.join(values)))
+        return number
+
+    def _select(self, aperture):
+        if aperture != self._aperture:
+            if aperture not in self._apertures.values():
+                raise ValueError('Aperture D{} is not defined'.format(aperture))
+            self._write('D{}*\n'.format(aperture))
+            self._aperture = aperture
+
+    def _interpolate(self, mode):
+        if mode != self._interpolation:
+            self._write('{}*\n'.format(mode))
+            self._interpolation = mode
+
+    def _coordinates(self, values):
+        return np.rint(np.asarray(values, dtype=np.float64) * self._scale).astype(np.int64)
+
+    def polarity(self, dark):
+        """Switches to dark (LPD) or clear (LPC) polarity for the primitives written after this"""
+        if dark != self._dark:
+            self._write('%LP{}*%\n'.format('D' if dark else 'C'))
+            self._dark = dark
+
+    def lines(self, starts, ends, aperture):
+        """Writes a line from every start to the matching end, stroked with aperture (one D code or one per line)"""
+        start = self._coordinates(_points(starts))
+        end = self._coordinates(_points(ends))
+        if len(start) != len(end):
+            raise ValueError('starts and ends must have the same length')
+        self._interpolate('G01')
+        for first, last, number in _runs(aperture, len(start)):
+            self._select(number)
+            self._write_rows('X%dY%dD02*\nX%dY%dD01*\n', start[first:last, 0], start[first:last, 1], end[first:last, 0], end[first:last, 1])
+
+    def arcs(self, starts, ends, centers, aperture, clockwise=False):
+        """Writes circular arcs from starts to ends around centers; clockwise is one flag or one per arc"""
+        start = self._coordinates(_points(starts))
+        end = self._coordinates(_points(ends))
+        offset = self._coordinates(_points(centers)) - start
+        modes = np.broadcast_to(np.where(np.asarray(clockwise), 2, 3), (len(start),))
+        for first, last, number in _runs(aperture, len(start)):
+            self._select(number)
+            self._write_rows('X%dY%dD02*\nG0%dX%dY%dI%dJ%dD01*\n',
+                             start[first:last, 0], start[first:last, 1], modes[first:last],
+                             end[first:last, 0], end[first:last, 1], offset[first:last, 0], offset[first:last, 1])
+        if len(start):
+            self._interpolation = 'G0{}'.format(modes[-1])
+
+    def flashes(self, points, aperture):
+        """Flashes aperture (one D code or one per point) at every point"""
+        point = self._coordinates(_points(points))
+        for first, last, number in _runs(aperture, len(point)):
+            self._select(number)
+            self._write_rows('X%dY%dD03*\n', point[first:last, 0], point[first:last, 1])
+
+    def region(self, points):
+        """Writes a filled polygon; the outline is closed automatically"""
+        point = self._coordinates(_points(points))
+        if len(point) < 3:
+            raise ValueError('A region needs at least 3 points')
+        if (point[0] != point[-1]).any():
+            point = np.concatenate([point, point[:1]])
+        self._interpolate('G01')
+        self._write('G36*\nX{}Y{}D02*\n'.format(point[0, 0], point[0, 1]))
+        self._write_rows('X%dY%dD01*\n', point[1:, 0], point[1:, 1])
+        self._write('G37*\n')
+
+    def regions(self, polygons):
+        for points in polygons:
+            self.region(points)
+
+    def _finish(self):
+        self._write('M02*\n')
+
+
+class ExcellonWriter(_Writer):
+    """Streams an Excellon drill file from arrays of hit positions
+
+    Tools are defined with add_tool() before the first hits are written, since Excellon lists them in the header.
+    Coordinates are written with an explicit decimal point, so no zero suppression applies.
+    """
+
+    def __init__(self, target=None, unit='in', decimal_digits=4, chunk_size=65536):
+        super().__init__(target, chunk_size)
+        self.unit = unit
+        self.decimal_digits = decimal_digits
+        self._tools = {}
+        self._tool = None
+        self._header_written = False
+
+    def add_tool(self, diameter):
+        """Defines a tool and returns its number; tools of the same diameter share a number"""
+        diameter = round(float(diameter), self.decimal_digits)
+        number = self._tools.get(diameter)
+        if number is None:
+            if self._header_written:
+                raise ValueError('Tools must be defined before the first hit')
+            number = self._tools[diameter] = len(self._tools) + 1
+        return number
+
+    def _write_header(self):
+        lines = ['M48', 'METRIC' if self.unit == 'mm' else 'INCH']
+        for diameter, number in self._tools.items():
+            lines.append('T{:02d}C{:.{}f}'.format(number, diameter, self.decimal_digits))
+        lines += ['%', 'G90', 'G05']
+        self._write('\n'.join(lines) + '\n')
+        self._header_written = True
+
+    def drills(self, points, tool):
+        """Drills with tool (one number or one per point) at every point"""
+        if not self._header_written:
+            self._write_header()
+        points = _points(points)
+        template = 'X%.{0}fY%.{0}f\n'.format(self.decimal_digits)
+        for first, last, number in _runs(tool, len(points)):
+            if number not in self._tools.values():
+                raise ValueError('Tool T{:02d} is not defined'.format(number))
+            if number != self._tool:
+                self._write('T{:02d}\n'.format(number))
+                self._tool = number
+            self._write_rows(template, points[first:last, 0], points[first:last, 1])
+
+    def _finish(self):
+        if not self._header_written:
+            self._write_header()
+        self._write('M30\n')
@@ -6,5 +6,6 @@ setuptools.setup(
     version='1.0',
     description='Thin Gerbv wrapper in Python',
     python_requires='>=3.7',
+    install_requires=['numpy'],
     url='https://github.com/elephantech/PyGerbv',
 )